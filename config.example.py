@@ -3,12 +3,26 @@ import discord
 DEFAULT_PREFIX = "?"
 
 SHARD_COUNT = 1
+# shards run by this host, split between clusters in contiguous ranges
 SHARD_IDS = [0]
+# number of worker processes, 1 runs everything in a single process
+CLUSTER_COUNT = 1
+# max_concurrency of /gateway/bot, identifies per 5 seconds
+IDENTIFY_CONCURRENCY = 1
 
 SUPPORT_GUILD_ID = -1
 DEFAULT_EMOJI_ID = -1
 OWNER_ID = -1
 
+# "full" caches every joined and online member and receives presences,
+# "lean" drops presences and member cache, members are fetched when a command needs them,
+# "minimal" also drops members intent, only members mentioned in messages can be resolved
+CACHE_PROFILE = "full"
+# guilds are chunked when a command needs their members, at most this many at once
+CHUNK_CONCURRENCY = 2
+# seconds after which members of an unused guild are dropped from the cache
+MEMBER_IDLE_EVICTION = 1800.0
+
 DEFAULT_STATUS = "あなたは私の友達です。"
 BRAND_COLOR = discord.Color(0x83D0ED)
 
@@ -16,6 +30,40 @@ IMGUR_ID = "asdasd"
 TOKEN = "bvnvbndsfg"
 
 REDIS_URI = "redis://localhost:6379/0"
+
+# (host, port) of the prometheus /metrics endpoint, None disables it.
+# cluster workers listen on port + cluster id
+METRICS_ADDRESS = None
+# event loop stalls longer than this many seconds are captured with a stack, None disables the watchdog
+LOOP_STALL_THRESHOLD = 0.25
+
+# commands per seconds allowed for a single user
+GLOBAL_RATE_LIMIT = (10, 10.0)
+# "local" keeps the limit per process, "redis" shares it through REDIS_URI
+RATE_LIMIT_BACKEND = "local"
+# "memory" keeps shared caches per process, "redis" shares them between processes and restarts
+CACHE_BACKEND = "memory"
+# AniList search results are cached through CACHE_BACKEND for this many seconds,
+# each process keeps up to this many bytes of them in memory
+ANILIST_CACHE_TTL = 900.0
+ANILIST_CACHE_BYTES = 8 * 1024 * 1024
+# requests per seconds to AniList, shared between processes like GLOBAL_RATE_LIMIT.
+# searches wait at most ANILIST_DEADLINE seconds for their turn, no more than ANILIST_MAX_WAITING at once
+ANILIST_RATE_LIMIT = (90, 60.0)
+ANILIST_MAX_WAITING = 50
+ANILIST_DEADLINE = 10.0
+# searches made within this many seconds are sent as a single request, up to ANILIST_BATCH_SIZE of them
+ANILIST_BATCH_WINDOW = 0.05
+ANILIST_BATCH_SIZE = 8
+# search results are also kept in this file for ANILIST_STORE_TTL seconds, so they survive restarts.
+# only the first cluster writes to it, the others on the same host read it. None disables it
+ANILIST_STORE_PATH = "anilist.db"
+ANILIST_STORE_TTL = 86400.0
+
+# either "postgres" or "sqlite", the latter keeps everything in a local file
+STORAGE_BACKEND = "postgres"
+SQLITE_PATH = "tomodachi.db"
+
 POSTGRES_CREDENTIALS = {
     "user": "username",
     "password": "password",
@@ -24,6 +72,26 @@ POSTGRES_CREDENTIALS = {
     "port": 5432,
 }
 POSTGRES_DSN = "postgresql://{user}:{password}@{host}:{port}/{database}".format(**POSTGRES_CREDENTIALS)
+# passed to asyncpg.create_pool, timeout is for opening a connection
+POSTGRES_POOL = {
+    "min_size": 10,
+    "max_size": 30,
+    "max_inactive_connection_lifetime": 300.0,
+    "statement_cache_size": 100,
+    "timeout": 10.0,
+}
+POSTGRES_ACQUIRE_TIMEOUT = 5.0
+POSTGRES_CONNECT_RETRIES = 5
+# how many guilds keep their prefix in memory
+PREFIX_CACHE_SIZE = 10_000
+# prefix and blacklist changes are written in batches instead of one query per command
+WRITE_BEHIND = False
+WRITE_BEHIND_INTERVAL = 1.0
+WRITE_BEHIND_MAX_PENDING = 500
 
 EXTENSIONS = ("default",)
+# extensions that register command stubs at startup and are imported on the first use,
+# they have to be listed in tomodachi/exts/manifest.py. listeners of such extension
+# start working only once it's loaded
+LAZY_EXTENSIONS = ()
 JISHAKU_FLAGS = ("HIDE",)
@@ -8,6 +8,7 @@ import asyncio
 import importlib
 import logging
 import os
+from multiprocessing.connection import Connection
 from typing import Any
 
 import discord
@@ -15,7 +16,11 @@ import discord
 import config
 import patches  # noqa
 from tomodachi.core.bot import Tomodachi
+from tomodachi.core.cluster import ClusterSupervisor, IPCChannel
 from tomodachi.utils import pg
+from tomodachi.utils.pgsql import PostgresBackend
+from tomodachi.utils.sqlite import SQLiteBackend
+from tomodachi.utils.watchdog import LoopWatchdog
 
 try:
     uvloop: Any = importlib.import_module("uvloop")
@@ -36,19 +41,70 @@ logging.basicConfig(level=logging.INFO, format=format_)
 logger = logging.getLogger("discord")
 logger.setLevel(logging.INFO)
 
-# Creating database pool
-loop = asyncio.get_event_loop()
-loop.run_until_complete(pg().setup(config.POSTGRES_DSN))
 
-# Running the bot
-tomodachi = Tomodachi()
-tomodachi.load_extension("jishaku")
+def make_storage_backend():
+    if config.STORAGE_BACKEND == "sqlite":
+        return SQLiteBackend(config.SQLITE_PATH)
 
-try:
-    loop.run_until_complete(tomodachi.start(config.TOKEN))
+    return PostgresBackend(
+        config.POSTGRES_DSN,
+        pool_options=config.POSTGRES_POOL,
+        acquire_timeout=config.POSTGRES_ACQUIRE_TIMEOUT,
+        connect_retries=config.POSTGRES_CONNECT_RETRIES,
+    )
+
+
+def run_bot(**options):
+    loop = asyncio.get_event_loop()
+
+    # Creating storage backend
+    loop.run_until_complete(
+        pg().setup(
+            make_storage_backend(),
+            prefix_cache_size=config.PREFIX_CACHE_SIZE,
+            write_behind=config.WRITE_BEHIND,
+            flush_interval=config.WRITE_BEHIND_INTERVAL,
+            max_pending_writes=config.WRITE_BEHIND_MAX_PENDING,
+        )
+    )
+
+    # Watching for callbacks that block the loop
+    watchdog = None
+    if config.LOOP_STALL_THRESHOLD is not None:
+        watchdog = LoopWatchdog(loop, threshold=config.LOOP_STALL_THRESHOLD)
+        watchdog.start()
+
+    # Running the bot
+    tomodachi = Tomodachi(watchdog=watchdog, **options)
+    tomodachi.load_extension("jishaku")
+
+    try:
+        loop.run_until_complete(tomodachi.start(config.TOKEN))
+
+    except KeyboardInterrupt:
+        loop.run_until_complete(tomodachi.logout())
+
+    finally:
+        if watchdog is not None:
+            watchdog.stop()
+        discord.client._cleanup_loop(loop)  # noqa
+
+
+def run_cluster(cluster_id: int, shard_ids: list[int], shard_count: int, conn: Connection):
+    # this is the entry point of a worker process
+    logging.info(f"cluster {cluster_id} is starting with shards {shard_ids}")
+    run_bot(shard_ids=shard_ids, shard_count=shard_count, cluster_id=cluster_id, ipc=IPCChannel(conn))
 
-except KeyboardInterrupt:
-    loop.run_until_complete(tomodachi.logout())
 
-finally:
-    discord.client._cleanup_loop(loop)  # noqa
+if __name__ == "__main__":
+    if config.CLUSTER_COUNT > 1:
+        supervisor = ClusterSupervisor(
+            run_cluster,
+            shard_ids=config.SHARD_IDS,
+            shard_count=config.SHARD_COUNT,
+            clusters=config.CLUSTER_COUNT,
+            identify_concurrency=config.IDENTIFY_CONCURRENCY,
+        )
+        supervisor.run()
+    else:
+        run_bot(shard_ids=config.SHARD_IDS, shard_count=config.SHARD_COUNT)
@@ -6,6 +6,8 @@
 
 import discord
 
+from tomodachi.utils.instrumentation import timed_wait
+
 
 class EmbedOverridden(discord.Embed):
     def __init__(self, **kwargs):
@@ -14,3 +16,7 @@ class EmbedOverridden(discord.Embed):
 
 
 discord.Embed = EmbedOverridden
+
+
+# time spent in discord rest calls is reported as a part of command latency
+discord.http.HTTPClient.request = timed_wait("discord")(discord.http.HTTPClient.request)
@@ -0,0 +1,93 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Fails when cold import of the bot takes longer than the budget.
+
+Usage: python scripts/importtime.py [--budget-ms 1500] [--top 15] [module ...]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what a worker process imports before it logs in
+DEFAULT_MODULES = ("tomodachi.core", "tomodachi.utils", "tomodachi.exts.tools", "tomodachi.exts.info")
+
+
+def config_env(directory):
+    """Returns environment that falls back to config.example.py when there is no config.py, as on CI."""
+    shutil.copy(os.path.join(ROOT, "config.example.py"), os.path.join(directory, "config.py"))
+
+    # the working directory comes first on sys.path, a real config.py still wins
+    path = [directory, os.environ.get("PYTHONPATH")]
+    return {**os.environ, "PYTHONPATH": os.pathsep.join(p for p in path if p)}
+
+
+def measure(modules, env=None):
+    """Returns (total microseconds, [(cumulative, self, name)]) of a cold import in a fresh interpreter."""
+    code = "; ".join(f"import {m}" for m in modules) or "pass"
+    # -X importtime writes to stderr, one line per imported module
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+
+    if proc.returncode != 0:
+        error = "\n".join(line for line in proc.stderr.splitlines() if not line.startswith("import time:"))
+        sys.exit(f"import failed:\n{error}")
+
+    entries, total = [], 0
+
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        cumulative_us = int(cumulative_us)
+
+        # top level imports are not indented, their cumulative times add up to the total
+        if not name[1:].startswith(" "):
+            total += cumulative_us
+
+        entries.append((cumulative_us, int(self_us), name.strip()))
+
+    return total, entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = config_env(directory)
+        total, entries = measure(args.modules, env)
+        # modules imported by the interpreter itself are not part of the budget
+        baseline, _ = measure((), env)
+        total -= baseline
+
+    print(f"{'cumulative':>11} {'self':>9}  module")
+    for cumulative_us, self_us, name in sorted(entries, reverse=True)[: args.top]:
+        print(f"{cumulative_us / 1000:>9.1f}ms {self_us / 1000:>7.1f}ms  {name}")
+
+    print(f"\ntotal import time: {total / 1000:.1f}ms, budget: {args.budget_ms:.1f}ms")
+
+    if total / 1000 > args.budget_ms:
+        sys.exit("import time is over the budget")
+
+
+if __name__ == "__main__":
+    main()
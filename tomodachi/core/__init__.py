@@ -7,6 +7,7 @@
 from .bot import *
 from .checks import *
 from .context import *
+from .converters import *
 from .exceptions import *
 from .icons import *
 from .menus import *
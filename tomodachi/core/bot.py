@@ -6,31 +6,62 @@
 
 from __future__ import annotations
 
-import asyncio
+import itertools
 import logging
-from typing import Optional, Union
+from typing import Any, Optional, Union
 
 import aiohttp
 import discord
 from discord.ext import commands
+from discord.ext.commands.view import StringView
+from discord.state import ConnectionState
 
 import config
+from tomodachi.core.chunker import MemberChunker
+from tomodachi.core.cluster import IPCChannel
 from tomodachi.core.context import TomodachiContext
 from tomodachi.core.icons import Icons
-from tomodachi.utils import pg, make_intents, make_cache_policy, AniList
+from tomodachi.core.lazy import LazyExtensions
+from tomodachi.core.prefixes import PrefixMatcher, PrefixMatch
+from tomodachi.core.startup import StartupOrchestrator
+from tomodachi.utils import (
+    pg,
+    JSON,
+    make_cache_profile,
+    make_rate_limiter,
+    make_cache_backend,
+    make_trace_config,
+    TieredCache,
+    MetricsServer,
+    metrics,
+)
+from tomodachi.exts.manifest import MANIFEST
+from tomodachi.utils.memory import CacheUsage, estimate_bytes
+from tomodachi.utils.watchdog import LoopWatchdog
 
 __all__ = ["Tomodachi"]
 
 
 class Tomodachi(commands.AutoShardedBot):
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        cluster_id: Optional[int] = None,
+        ipc: Optional[IPCChannel] = None,
+        watchdog: Optional[LoopWatchdog] = None,
+        **kwargs,
+    ):
+        # Intents, member and message caches are picked together
+        self.cache_profile = profile = make_cache_profile(config.CACHE_PROFILE)
+
         super().__init__(
             *args,
             **kwargs,
-            max_messages=150,
+            max_messages=profile.max_messages,
             command_prefix=self.get_prefix,
-            intents=make_intents(),
-            member_cache_flags=make_cache_policy(),
+            intents=profile.intents,
+            member_cache_flags=profile.member_cache_flags,
+            chunk_guilds_at_startup=profile.chunk_guilds_at_startup,
             owner_id=config.OWNER_ID,
         )
         self._BotBase__cogs = commands.core._CaseInsensitiveDict()  # noqa
@@ -38,102 +69,291 @@ class Tomodachi(commands.AutoShardedBot):
         # Alias to config module
         self.config = config
 
+        # Channel to the cluster supervisor, None when running as a single process
+        self.cluster_id = cluster_id
+        self.ipc = ipc
+        self.cluster_queries = {
+            "guild_count": self._query_guild_count,
+            "latency": self._query_latency,
+        }
+
+        if ipc is not None:
+            for name, handler in self.cluster_queries.items():
+                ipc.add_handler(name, handler)
+            ipc.start(self.loop)
+
         self.pg = pg()
-        self.prefixes = {}
-        # tuple with user ids
-        self.blacklist = ()
+        # both caches are shared with the pg singleton and
+        # receive changes made by other bot processes
+        self.prefixes = self.pg.prefixes
+        self.__prefix_matcher = PrefixMatcher()
+        # set with user ids, shared with the pg singleton
+        self.blacklist = self.pg.blacklist
 
         # Alias to Icons singleton
         self.icon = Icons()
         # Faster access to support guild data
         self.support_guild: Optional[discord.Guild] = None
 
-        # Global rate limit cooldowns mapping
-        self.global_rate_limit = commands.CooldownMapping.from_cooldown(10, 10, commands.BucketType.user)
-
-        self.session = aiohttp.ClientSession()
-
-        self.__once_ready_ = asyncio.Event()
-        self.loop.create_task(self.once_ready())
+        # Global per-user rate limit, optionally shared between processes
+        self.global_rate_limit = make_rate_limiter(
+            *config.GLOBAL_RATE_LIMIT,
+            backend=config.RATE_LIMIT_BACKEND,
+            uri=config.REDIS_URI,
+        )
 
-        # Fetch custom prefixes and blacklisted users
-        self.loop.create_task(self.fetch_blacklist())
-        self.loop.create_task(self.fetch_prefixes())
+        # Requests to AniList are paced by this limiter, see AniList.setup
+        self.anilist_rate_limit = make_rate_limiter(
+            *config.ANILIST_RATE_LIMIT,
+            backend=config.RATE_LIMIT_BACKEND,
+            uri=config.REDIS_URI,
+            namespace="tomodachi:anilist",
+        )
+        # Search results that outlive restarts, created along with the AniList client
+        self.anilist_store = None
+
+        # Shared tier of namespaced caches, see Tomodachi.cache
+        self.cache_backend = make_cache_backend(config.CACHE_BACKEND, uri=config.REDIS_URI)
+        self.caches: dict[str, TieredCache] = {}
+
+        # Requests of this session count as external http time of commands
+        self.session = aiohttp.ClientSession(trace_configs=[make_trace_config()])
+
+        # Per-command latencies, served in prometheus format if configured
+        self.metrics = metrics
+        self.metrics_server: Optional[MetricsServer] = None
+        # Event loop stalls, None when the watchdog is disabled
+        self.watchdog = watchdog
+
+        if config.METRICS_ADDRESS is not None:
+            host, port = config.METRICS_ADDRESS
+            self.metrics_server = MetricsServer(host, port + (cluster_id or 0), self.render_metrics)
+            self.loop.create_task(self.metrics_server.start())
+
+        # Members are requested per guild on demand and dropped once the guild is idle
+        self.chunker = MemberChunker(self, concurrency=config.CHUNK_CONCURRENCY, idle_after=config.MEMBER_IDLE_EVICTION)
+        self.loop.create_task(self.chunker.run_eviction())
+
+        # Extensions that are imported on the first use of their commands
+        self.lazy_extensions = LazyExtensions(self, MANIFEST)
+
+        # Startup steps, they begin right after login instead of after ready
+        self.startup = StartupOrchestrator()
+        self.startup.add("extensions", self.load_extensions)
+        self.startup.add("anilist", self.setup_anilist)
+        # blacklisted users are fetched up front, custom prefixes are loaded on demand
+        self.startup.add("blacklist", self.fetch_blacklist)
+        self.startup.add("support_guild", self.fetch_support_guild)
+        self.startup.add("icons", self.setup_icons, after=("support_guild",))
+        self.startup.add("ready", self.wait_until_ready)
+        self.startup.add("store_guilds", self.store_guilds, after=("ready",))
 
     async def close(self):
         if not self.session.closed:
             await self.session.close()
 
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+
+        await self.global_rate_limit.close()
+        await self.anilist_rate_limit.close()
+        await self.cache_backend.close()
+
+        if self.anilist_store is not None:
+            await self.anilist_store.close()
+
+        # flushes pending writes before the pool goes away
+        await self.pg.close()
         await super().close()
 
-    async def get_prefix(self, message: discord.Message):
-        prefixes = (f'<@!{self.user.id}> ', f'<@{self.user.id}> ')
+    async def cache_usage(self) -> list[CacheUsage]:
+        """Counts cached discord objects and estimates memory they take, each kind without the others.
 
-        if not (p := self.prefixes.get(message.guild.id)):
-            prefixes += (config.DEFAULT_PREFIX,)
-        else:
-            prefixes += (p,)
+        Only a small sample of every kind is walked, yielding to the loop between objects.
+        """
+        guilds = self.guilds
+        members = sum(len(g._members) for g in guilds)  # noqa
+        # bot.users copies the whole user cache into a list
+        users = self._connection._users  # noqa
+        messages = self.cached_messages
 
-        return prefixes
+        async def usage(name, objects, count, *stop):
+            return CacheUsage(name, count, await estimate_bytes(objects, count, stop=(ConnectionState, *stop)))
+
+        in_message = (discord.Guild, discord.Member, discord.User, discord.abc.GuildChannel)
+
+        return [
+            await usage("guilds", guilds, len(guilds), discord.Member, discord.User),
+            await usage(
+                "members",
+                itertools.chain.from_iterable(g._members.values() for g in guilds),  # noqa
+                members,
+                discord.Guild,
+                discord.User,
+            ),
+            await usage("users", users.values(), len(users)),
+            await usage("messages", messages, len(messages), *in_message),
+        ]
+
+    def cache(self, namespace: str, **options) -> TieredCache:
+        """Returns cache of the namespace, options are applied only when it's created."""
+        if (cache := self.caches.get(namespace)) is None:
+            cache = self.caches[namespace] = TieredCache(namespace, self.cache_backend, **options)
+
+        return cache
+
+    @property
+    def prefix_matcher(self) -> PrefixMatcher:
+        # mention prefixes are known only after the client has logged in
+        if not self.__prefix_matcher.mentions and self.user is not None:
+            self.__prefix_matcher.set_user(self.user.id)
+
+        return self.__prefix_matcher
+
+    async def guild_prefix(self, guild: Optional[discord.Guild]) -> str:
+        if guild is None:
+            return config.DEFAULT_PREFIX
+
+        return await self.prefixes.get(guild.id) or config.DEFAULT_PREFIX
+
+    async def get_prefix(self, message: discord.Message):
+        return self.prefix_matcher.prefixes(await self.guild_prefix(message.guild))
 
     async def update_prefix(self, guild_id: int, new_prefix: str):
-        prefix = await self.pg.update_prefix(guild_id, new_prefix)
-        self.prefixes[guild_id] = prefix
-        return self.prefixes[guild_id]
+        return await self.pg.update_prefix(guild_id, new_prefix)
+
+    async def get_context(
+        self, message, *, cls=None, match: Optional[PrefixMatch] = None
+    ) -> Union[TomodachiContext, commands.Context]:
+        cls = cls or TomodachiContext
 
-    async def get_context(self, message, *, cls=None) -> Union[TomodachiContext, commands.Context]:
-        return await super().get_context(message, cls=cls or TomodachiContext)
+        if match is None:
+            return await super().get_context(message, cls=cls)
+
+        # prefix and invoker are already known, so the view only has to be moved past them
+        prefix, invoker = match
+        view = StringView(message.content)
+        view.skip_string(prefix)
+        view.get_word()
+
+        ctx = cls(prefix=prefix, view=view, bot=self, message=message)
+        ctx.invoked_with = invoker
+        ctx.command = self.all_commands.get(invoker)
+
+        return ctx
 
     async def process_commands(self, message: discord.Message):
         if message.author.bot:
             return
 
+        # no-op once the blacklist is loaded
+        await self.startup.wait("blacklist")
+
         if message.author.id in self.blacklist:
             return
 
-        ctx = await self.get_context(message)
+        # most of messages are just chat, those are dropped before any context is built
+        prefix = await self.guild_prefix(message.guild)
+        match = self.prefix_matcher.match(message.content, prefix)
+        if match is None or match[1] not in self.all_commands:
+            return
 
-        bucket = self.global_rate_limit.get_bucket(ctx.message)
-        retry_after = bucket.update_rate_limit()
-
-        if retry_after and ctx.author.id != self.owner_id:
-            return await message.channel.send(
-                content=f"You are being globally rate limited. Please, wait `{retry_after:.2f}` seconds.",
-                delete_after=retry_after,
-            )
+        if message.author.id != self.owner_id:
+            if retry_after := await self.global_rate_limit.hit(message.author.id):
+                return await message.channel.send(
+                    content=f"You are being globally rate limited. Please, wait `{retry_after:.2f}` seconds.",
+                    delete_after=retry_after,
+                )
 
+        ctx = await self.get_context(message, match=match)
         await self.invoke(ctx)
 
-    async def fetch_prefixes(self):
-        await self.pg.connection_established.wait()
+    async def invoke(self, ctx: commands.Context):
+        if ctx.command is None:
+            return await super().invoke(ctx)
 
-        async with self.pg.pool.acquire() as conn:
-            records = await conn.fetch("SELECT guild_id, prefix FROM guilds;")
+        # errors are handled inside of invoke, they are visible only through command_failed
+        with self.metrics.invocation(ctx.command.qualified_name, ctx.command.cog_name) as outcome:
+            await super().invoke(ctx)
+            outcome.failed = ctx.command_failed
 
-        self.prefixes.update({k: v for k, v in map(tuple, records)})
+    def render_metrics(self) -> str:
+        return self.metrics.render_prometheus(self.pg.queries)
 
-    async def fetch_blacklist(self):
-        await self.pg.connection_established.wait()
+    async def before_identify_hook(self, shard_id, *, initial=False):
+        if self.ipc is None:
+            return await super().before_identify_hook(shard_id, initial=initial)
 
-        async with self.pg.pool.acquire() as conn:
-            records = await conn.fetch("SELECT DISTINCT * FROM blacklisted;")
+        # supervisor spaces out identifies of all clusters
+        await self.ipc.request("identify", shard_id)
 
-        self.blacklist = tuple(r["user_id"] for r in records)
+    async def cluster_query(self, name: str) -> dict[int, Any]:
+        """Returns answers of every cluster keyed by cluster id."""
+        if self.ipc is None:
+            return {0: await self.cluster_queries[name](None)}
 
-    async def on_ready(self):
-        if not self.__once_ready_.is_set():
-            self.__once_ready_.set()
+        return await self.ipc.request("query", name, timeout=10.0)
 
-    async def once_ready(self):
-        await self.__once_ready_.wait()
+    async def _query_guild_count(self, _data):
+        return len(self.guilds)
 
-        for guild in self.guilds:
-            self.loop.create_task(self.pg.store_guild(guild.id))
+    async def _query_latency(self, _data):
+        return self.latency
 
-        self.support_guild = support_guild = await self.fetch_guild(config.SUPPORT_GUILD_ID)
-        await self.icon.setup(support_guild.emojis)
-        await AniList.setup(self.session)
+    async def fetch_blacklist(self):
+        await self.pg.connection_established.wait()
+        await self.pg.fetch_blacklist()
+
+    async def login(self, *args, **kwargs):
+        await super().login(*args, **kwargs)
+        # steps that only need the rest api run while the gateway is connecting
+        self.loop.create_task(self.startup.run())
 
+    async def load_extensions(self):
+        # commands become available before ready, resources they use are filled in by other steps
         for ext in config.EXTENSIONS:
+            if ext in config.LAZY_EXTENSIONS and self.lazy_extensions.register(ext):
+                logging.info(f"registered stubs of {ext}")
+                continue
+
             self.load_extension(f"tomodachi.exts.{ext}")
             logging.info(f"loaded {ext}")
+
+    async def setup_anilist(self):
+        from tomodachi.utils.apis import AniList, PageStore
+
+        if config.ANILIST_STORE_PATH is not None:
+            # clusters of one host share the file, a single writer keeps it consistent
+            self.anilist_store = PageStore(
+                config.ANILIST_STORE_PATH,
+                ttl=config.ANILIST_STORE_TTL,
+                writer=not self.cluster_id,
+            )
+            self.anilist_store.start_compaction()
+
+        await AniList.setup(
+            self.session,
+            cache=self.cache(
+                "anilist",
+                ttl=config.ANILIST_CACHE_TTL,
+                local_ttl=config.ANILIST_CACHE_TTL,
+                maxsize=10_000,
+                max_bytes=config.ANILIST_CACHE_BYTES,
+                serializer=JSON,
+            ),
+            rate_limiter=self.anilist_rate_limit,
+            max_waiting=config.ANILIST_MAX_WAITING,
+            deadline=config.ANILIST_DEADLINE,
+            batch_window=config.ANILIST_BATCH_WINDOW,
+            batch_size=config.ANILIST_BATCH_SIZE,
+            store=self.anilist_store,
+        )
+
+    async def fetch_support_guild(self):
+        self.support_guild = await self.fetch_guild(config.SUPPORT_GUILD_ID)
+
+    async def setup_icons(self):
+        await self.icon.setup(self.support_guild.emojis)
+
+    async def store_guilds(self):
+        await self.pg.store_guilds([guild.id for guild in self.guilds])
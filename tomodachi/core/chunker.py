@@ -0,0 +1,103 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING
+
+import discord
+
+from tomodachi.utils.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from tomodachi.core.bot import Tomodachi
+
+__all__ = ["MemberChunker"]
+
+
+class MemberChunker:
+    """Requests members of a guild when a command needs them instead of at startup.
+
+    Concurrent requests for the same guild share a single chunk, at most ``concurrency``
+    guilds are chunked at once. Members of guilds that were not used for ``idle_after``
+    seconds are dropped from the cache.
+    """
+
+    def __init__(self, bot: Tomodachi, *, concurrency: int = 2, idle_after: float = 1800.0):
+        self.bot = bot
+        self.idle_after = idle_after
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chunks: SingleFlight[None] = SingleFlight()
+        # guild id -> monotonic time of the last use, only for guilds chunked by this chunker
+        self._last_used: dict[int, float] = {}
+
+        self.chunks = 0
+        self.evictions = 0
+
+    @property
+    def stats(self):
+        return {
+            "chunked": len(self._last_used),
+            "pending": len(self._chunks),
+            "chunks": self.chunks,
+            "evictions": self.evictions,
+        }
+
+    async def chunk(self, guild: discord.Guild):
+        """Waits until all members of the guild are cached."""
+        if guild.id in self._last_used:
+            self._last_used[guild.id] = time.monotonic()
+
+        if guild.chunked or not self.bot.intents.members:
+            return
+
+        await self._chunks.run(guild.id, lambda: self._chunk(guild))
+
+    async def _chunk(self, guild: discord.Guild):
+        async with self._semaphore:
+            started = time.perf_counter()
+            await guild.chunk(cache=True)
+
+        self.chunks += 1
+        self._last_used[guild.id] = time.monotonic()
+        logging.debug(f"chunked {guild.member_count} members of {guild.id} in {time.perf_counter() - started:.2f}s")
+
+    def evict_idle(self):
+        """Drops members of guilds that were not used for a while, except the ones ``member_cache_flags`` keep."""
+        flags = self.bot._connection.member_cache_flags  # noqa
+        # members who joined while the bot runs can't be told apart from chunked ones
+        if flags.joined:
+            return
+
+        deadline = time.monotonic() - self.idle_after
+        self_id = self.bot.user.id
+
+        for guild_id, last_used in list(self._last_used.items()):
+            if last_used > deadline or guild_id in self._chunks:
+                continue
+
+            del self._last_used[guild_id]
+
+            if (guild := self.bot.get_guild(guild_id)) is None:
+                continue
+
+            guild._members = {  # noqa
+                member.id: member
+                for member in guild._members.values()  # noqa
+                if member.id == self_id
+                or (flags.online and member.raw_status != "offline")
+                or (flags.voice and member.voice is not None)
+            }
+            self.evictions += 1
+
+    async def run_eviction(self, *, interval: float = 300.0):
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
@@ -0,0 +1,269 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.connection import Connection
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+__all__ = ["IPCChannel", "ClusterSupervisor", "split_shards"]
+
+Handler = Callable[[Any], Awaitable[Any]]
+
+# discord allows a single identify per rate limit bucket every 5 seconds
+IDENTIFY_INTERVAL = 5.0
+
+
+def split_shards(shard_ids: Sequence[int], clusters: int) -> list[list[int]]:
+    """Splits shard ids into ``clusters`` contiguous ranges of nearly equal size."""
+    size, extra = divmod(len(shard_ids), clusters)
+    ranges, start = [], 0
+
+    for i in range(clusters):
+        end = start + size + (i < extra)
+        ranges.append(list(shard_ids[start:end]))
+        start = end
+
+    return [r for r in ranges if r]
+
+
+class IPCChannel:
+    """Request/response messaging over a multiprocessing pipe inside an event loop.
+
+    Messages are dicts: requests carry ``op``, ``id`` and ``data``,
+    responses carry ``re`` with id of the request and ``data``.
+    """
+
+    def __init__(self, conn: Connection):
+        self.conn = conn
+        self.handlers: dict[str, Handler] = {}
+        self._waiters: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[threading.Thread] = None
+        self._closed = False
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        # proactor loop of windows has no add_reader, a blocking recv in a thread works everywhere
+        self._reader = threading.Thread(target=self._read, name="ipc-reader", daemon=True)
+        self._reader.start()
+
+    def stop(self):
+        self._closed = True
+
+        for waiter in self._waiters.values():
+            if not waiter.done():
+                waiter.set_exception(ConnectionError("IPC channel closed"))
+
+    def add_handler(self, op: str, handler: Handler):
+        self.handlers[op] = handler
+
+    async def request(self, op: str, data: Any = None, *, timeout: Optional[float] = None) -> Any:
+        request_id = next(self._ids)
+        waiter = self._waiters[request_id] = self._loop.create_future()
+
+        try:
+            self.conn.send({"op": op, "id": request_id, "data": data})
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            self._waiters.pop(request_id, None)
+
+    def _read(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+
+            try:
+                self._loop.call_soon_threadsafe(self._dispatch, message)
+            except RuntimeError:
+                # the loop is closed already
+                return
+
+        try:
+            self._loop.call_soon_threadsafe(self.stop)
+        except RuntimeError:
+            pass
+
+    def _dispatch(self, message: dict):
+        if self._closed:
+            return
+
+        if "re" in message:
+            if (waiter := self._waiters.get(message["re"])) and not waiter.done():
+                waiter.set_result(message["data"])
+            return
+
+        self._loop.create_task(self._respond(message))
+
+    async def _respond(self, message: dict):
+        handler = self.handlers.get(message["op"])
+
+        try:
+            data = await handler(message["data"]) if handler else None
+        except Exception:  # noqa
+            logging.exception(f"IPC handler for {message['op']} failed")
+            data = None
+
+        try:
+            self.conn.send({"re": message["id"], "data": data})
+        except (BrokenPipeError, OSError):
+            pass
+
+
+class _Worker:
+    __slots__ = ("cluster_id", "shard_ids", "process", "channel", "restarts", "started_at", "restart_at")
+
+    def __init__(self, cluster_id: int, shard_ids: list[int]):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.process: Optional[multiprocessing.Process] = None
+        self.channel: Optional[IPCChannel] = None
+        self.restarts = 0
+        self.started_at = 0.0
+        # monotonic time of a delayed restart after a crash
+        self.restart_at: Optional[float] = None
+
+
+class ClusterSupervisor:
+    """Runs every cluster of shards in its own process and restarts crashed ones.
+
+    ``target`` is called in the worker process as
+    ``target(cluster_id, shard_ids, shard_count, conn)``.
+    """
+
+    def __init__(
+        self,
+        target: Callable[[int, list[int], int, Connection], None],
+        *,
+        shard_ids: Sequence[int],
+        shard_count: int,
+        clusters: int,
+        identify_concurrency: int = 1,
+    ):
+        self.target = target
+        self.shard_count = shard_count
+        self.identify_concurrency = identify_concurrency
+
+        self.workers = [_Worker(i, ids) for i, ids in enumerate(split_shards(shard_ids, clusters))]
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._identify_locks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._last_identify: dict[int, float] = {}
+        self._closing = False
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        try:
+            loop.run_until_complete(self.supervise())
+        except KeyboardInterrupt:
+            self._closing = True
+        finally:
+            for worker in self.workers:
+                self._terminate(worker)
+            loop.close()
+
+    async def supervise(self, *, check_interval: float = 5.0):
+        for worker in self.workers:
+            self._spawn(worker)
+
+        while any(w.process is not None for w in self.workers):
+            await asyncio.sleep(check_interval)
+
+            for worker in self.workers:
+                if worker.process is None:
+                    continue
+
+                # a crash-looping cluster waits for its turn without holding up the others
+                if worker.restart_at is not None:
+                    if time.monotonic() >= worker.restart_at:
+                        worker.restart_at = None
+                        self._spawn(worker)
+                    continue
+
+                if worker.process.is_alive():
+                    continue
+
+                worker.channel.stop()
+
+                # clean exit means the cluster was shut down on purpose
+                if worker.process.exitcode == 0:
+                    logging.info(f"cluster {worker.cluster_id} stopped")
+                    worker.process = None
+                    continue
+
+                logging.warning(f"cluster {worker.cluster_id} exited with code {worker.process.exitcode}, restarting")
+
+                # crash loops are slowed down, clusters that ran for a while restart right away
+                if time.monotonic() - worker.started_at < 60.0:
+                    worker.restarts += 1
+                    worker.restart_at = time.monotonic() + min(2 ** worker.restarts, 300)
+                else:
+                    worker.restarts = 0
+                    self._spawn(worker)
+
+    def _spawn(self, worker: _Worker):
+        parent_conn, child_conn = self._ctx.Pipe()
+
+        worker.process = self._ctx.Process(
+            target=self.target,
+            args=(worker.cluster_id, worker.shard_ids, self.shard_count, child_conn),
+            name=f"tomodachi-cluster-{worker.cluster_id}",
+            daemon=False,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        child_conn.close()
+
+        worker.channel = channel = IPCChannel(parent_conn)
+        channel.add_handler("identify", self._on_identify)
+        channel.add_handler("query", self._on_query)
+        channel.start(asyncio.get_running_loop())
+
+        logging.info(f"started cluster {worker.cluster_id} with shards {worker.shard_ids}")
+
+    def _terminate(self, worker: _Worker):
+        if worker.process is not None and worker.process.is_alive():
+            worker.process.terminate()
+            worker.process.join(10.0)
+
+    async def _on_identify(self, shard_id: int):
+        """Holds identify of a shard until its rate limit bucket is free, across all clusters."""
+        bucket = shard_id % self.identify_concurrency
+
+        async with self._identify_locks[bucket]:
+            if (last := self._last_identify.get(bucket)) is not None:
+                if (delay := last + IDENTIFY_INTERVAL - time.monotonic()) > 0:
+                    await asyncio.sleep(delay)
+
+            self._last_identify[bucket] = time.monotonic()
+
+        return True
+
+    async def _on_query(self, name: str, *, timeout: float = 5.0):
+        """Asks every running cluster and returns their answers keyed by cluster id."""
+
+        async def ask(worker: _Worker):
+            try:
+                return await worker.channel.request(name, timeout=timeout)
+            except (asyncio.TimeoutError, ConnectionError, OSError):
+                return None
+
+        running = [w for w in self.workers if w.process is not None and w.process.is_alive()]
+        answers = await asyncio.gather(*(ask(w) for w in running))
+
+        return {w.cluster_id: a for w, a in zip(running, answers)}
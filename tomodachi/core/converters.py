@@ -0,0 +1,31 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import discord
+from discord.ext import commands
+
+if TYPE_CHECKING:
+    from tomodachi.core.context import TomodachiContext
+
+__all__ = ["CachedMember"]
+
+
+class CachedMember(commands.MemberConverter):
+    """Member converter that makes sure members of the guild are cached first.
+
+    Members are chunked only when an argument is actually converted,
+    so help and permission checks never trigger it.
+    """
+
+    async def convert(self, ctx: TomodachiContext, argument: str) -> discord.Member:
+        if ctx.guild is not None:
+            await ctx.bot.chunker.chunk(ctx.guild)
+
+        return await super().convert(ctx, argument)
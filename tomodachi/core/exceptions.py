@@ -6,7 +6,7 @@
 
 from discord.ext.commands import CommandError
 
-__all__ = ["AniListException"]
+__all__ = ["AniListException", "AniListBusy"]
 
 
 class Blacklisted(CommandError):
@@ -16,3 +16,12 @@ class Blacklisted(CommandError):
 class AniListException(CommandError):
     def __init__(self, data):
         self.data = data
+
+
+class AniListBusy(AniListException):
+    def __init__(self, retry_after: float):
+        super().__init__(None)
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return f"AniList is busy right now. Please, try again in `{self.retry_after:.2f}` seconds."
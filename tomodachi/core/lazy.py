@@ -0,0 +1,138 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, NamedTuple, Optional
+
+from discord.ext import commands
+
+if TYPE_CHECKING:
+    from tomodachi.core.bot import Tomodachi
+
+__all__ = ["StubCommand", "LazyExtension", "LazyExtensions"]
+
+
+class StubCommand(NamedTuple):
+    name: str
+    aliases: tuple[str, ...] = ()
+    help: Optional[str] = None
+    # signature of the real command, help shows it before the extension is loaded
+    usage: Optional[str] = None
+
+
+class LazyExtension(NamedTuple):
+    """What an extension registers, known without importing it."""
+
+    cog: str
+    commands: tuple[StubCommand, ...]
+    owner_only: bool = False
+
+
+class LazyExtensions:
+    """Registers stub cogs in place of extensions and loads the real ones on first use.
+
+    A stub command loads its extension, then hands its context over to the real command,
+    which runs its own checks, cooldowns and converters. Errors of the real command go
+    to its own handlers with its own context. The invocation itself (global checks, metrics)
+    happens only once, for the stub.
+    """
+
+    def __init__(self, bot: Tomodachi, manifest: dict[str, LazyExtension], *, package: str = "tomodachi.exts"):
+        self.bot = bot
+        self.manifest = manifest
+        self.package = package
+
+        self.stubs: dict[str, commands.Cog] = {}
+        # extension name -> seconds it took to load
+        self.loaded: dict[str, float] = {}
+        self._locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def register(self, extension: str) -> bool:
+        """Adds stub cog of the extension, returns False if manifest does not know it."""
+        if (entry := self.manifest.get(extension)) is None:
+            logging.warning(f"extension {extension} is not in the manifest, it can't be loaded lazily")
+            return False
+
+        stub = self.stubs[extension] = self._make_stub(extension, entry)
+        self.bot.add_cog(stub)
+
+        return True
+
+    async def load(self, extension: str):
+        async with self._locks[extension]:
+            if extension not in self.stubs:
+                return
+
+            stub = self.stubs.pop(extension)
+            self.bot.remove_cog(stub.qualified_name)
+
+            started = time.perf_counter()
+
+            try:
+                self.bot.load_extension(f"{self.package}.{extension}")
+            except Exception:
+                # stub stays, so the next invocation tries again
+                self.stubs[extension] = stub
+                self.bot.add_cog(stub)
+                raise
+
+            self.loaded[extension] = elapsed = time.perf_counter() - started
+            logging.info(f"loaded {extension} on demand in {elapsed * 1000:.0f}ms")
+
+            self._check_manifest(extension)
+
+    def _check_manifest(self, extension: str):
+        entry = self.manifest[extension]
+
+        if (cog := self.bot.get_cog(entry.cog)) is None:
+            return logging.warning(f"manifest of {extension} names cog {entry.cog}, but it was not added")
+
+        expected = {c.name for c in entry.commands}
+        actual = {c.name for c in cog.get_commands()}
+
+        if expected != actual:
+            logging.warning(f"manifest of {extension} is out of date: {sorted(expected)} != {sorted(actual)}")
+
+    def _make_stub(self, extension: str, entry: LazyExtension) -> commands.Cog:
+        async def callback(_cog, ctx: commands.Context):
+            await self.load(extension)
+
+            real = await self.bot.get_context(ctx.message)
+            # a command that is still a stub means the extension didn't replace it
+            if real.command is None or real.command.cog is stub:
+                return
+
+            try:
+                await real.command.invoke(real)
+            except commands.CommandError as e:
+                # local and cog error handlers of the real command expect its context, not the stub's
+                await real.command.dispatch_error(real, e)
+                ctx.command_failed = True
+
+        checks = [commands.is_owner().predicate] if entry.owner_only else []
+        attrs = {
+            f"stub_{i}": commands.Command(
+                callback,
+                name=c.name,
+                aliases=list(c.aliases),
+                help=c.help,
+                usage=c.usage,
+                checks=list(checks),
+                # arguments are parsed by the real command
+                ignore_extra=True,
+            )
+            for i, c in enumerate(entry.commands)
+        }
+
+        cls = commands.CogMeta(entry.cog, (commands.Cog,), attrs, name=entry.cog)
+        stub = cls()
+
+        return stub
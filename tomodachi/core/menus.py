@@ -7,17 +7,30 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Union, final, Optional
+from typing import Any, Union, final, Optional, Protocol, runtime_checkable
 
 import discord
 from discord.ext import menus, commands
 
 from tomodachi.core.context import TomodachiContext
 
-__all__ = ["TomodachiMenu"]
+__all__ = ["TomodachiMenu", "AsyncEntries"]
 
 Context = Union[TomodachiContext, commands.Context]
-MenuEntries = Union[list[Any], tuple[Any], set[Any]]
+
+
+@runtime_checkable
+class AsyncEntries(Protocol):
+    """Entries that are fetched as they are accessed, length is the total number of them."""
+
+    def __len__(self) -> int:
+        ...
+
+    async def get(self, index: int) -> Any:
+        ...
+
+
+MenuEntries = Union[list[Any], tuple[Any], set[Any], AsyncEntries]
 
 
 class IndexNotChanged(Exception):
@@ -68,12 +81,24 @@ class TomodachiMenu(menus.Menu):
         self.embed.set_footer(text=f"Page {self.current_index + 1} / {self.max_index + 1}")
         self.embed.description = payload
 
+    async def get_entry(self, index: int):
+        if not isinstance(self.entries, AsyncEntries):
+            return self.entries[index]
+
+        try:
+            return await self.entries.get(index)
+        except IndexError:
+            # total of async entries can shrink once they are fetched
+            self.max_index = len(self.entries) - 1
+            self.current_index = min(self.current_index, self.max_index)
+            return await self.entries.get(self.current_index)
+
     async def send_initial_message(self, ctx, channel):
-        await self.format_embed(self.entries[0])
+        await self.format_embed(await self.get_entry(0))
         return await channel.send(embed=self.embed)
 
     async def update_page(self):
-        await self.format_embed(self.entries[self.current_index])
+        await self.format_embed(await self.get_entry(self.current_index))
         await self.message.edit(embed=self.embed)
 
     @staticmethod
@@ -0,0 +1,62 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+__all__ = ["PrefixMatcher", "PrefixMatch"]
+
+# mirrors StringView.get_word, which reads everything up to the first whitespace
+_INVOKER_RE = re.compile(r"\S*")
+
+PrefixMatch = tuple[str, str]
+
+
+class PrefixMatcher:
+    """Matches message content against the mention prefixes and a guild prefix.
+
+    Messages are filtered by their first character before any string comparison,
+    so plain chat is rejected without building a context or a list of prefixes.
+    """
+
+    __slots__ = ("_mentions", "_mention_heads")
+
+    def __init__(self):
+        self._mentions: tuple[str, ...] = ()
+        self._mention_heads: frozenset[str] = frozenset()
+
+    @property
+    def mentions(self):
+        return self._mentions
+
+    def set_user(self, user_id: int):
+        self._mentions = (f"<@!{user_id}> ", f"<@{user_id}> ")
+        self._mention_heads = frozenset(m[0] for m in self._mentions)
+
+    def prefixes(self, prefix: str) -> tuple[str, ...]:
+        return self._mentions + (prefix,)
+
+    def match(self, content: str, prefix: str) -> Optional[PrefixMatch]:
+        """Returns matched prefix and invoked command name or None if content can't be a command."""
+        if not content:
+            return None
+
+        head = content[0]
+        matched = None
+
+        if head in self._mention_heads:
+            matched = next((m for m in self._mentions if content.startswith(m)), None)
+
+        if matched is None:
+            if not content.startswith(prefix):
+                return None
+
+            matched = prefix
+
+        invoker = _INVOKER_RE.match(content, len(matched)).group()
+        return matched, invoker
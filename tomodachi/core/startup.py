@@ -0,0 +1,129 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional, Sequence
+
+__all__ = ["StartupOrchestrator", "StartupError"]
+
+StepFunc = Callable[[], Awaitable[None]]
+
+
+class StartupError(Exception):
+    pass
+
+
+class _Step:
+    __slots__ = ("name", "func", "after", "done", "failed", "duration")
+
+    def __init__(self, name: str, func: StepFunc, after: Sequence[str]):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.done = asyncio.Event()
+        self.failed = False
+        self.duration: Optional[float] = None
+
+
+class StartupOrchestrator:
+    """Runs startup steps as soon as the steps they depend on are finished.
+
+    Steps without a dependency between them run concurrently. A step that fails is logged,
+    steps that depend on it are skipped, the rest of startup carries on.
+    """
+
+    def __init__(self):
+        self.steps: dict[str, _Step] = {}
+        self.started_at: Optional[float] = None
+
+    def add(self, name: str, func: StepFunc, *, after: Sequence[str] = ()):
+        if name in self.steps:
+            raise StartupError(f"step {name} is added already")
+
+        self.steps[name] = _Step(name, func, after)
+
+    def step(self, name: str, *, after: Sequence[str] = ()):
+        """Decorator version of ``add``."""
+
+        def decorator(func: StepFunc):
+            self.add(name, func, after=after)
+            return func
+
+        return decorator
+
+    def is_done(self, name: str) -> bool:
+        return self.steps[name].done.is_set()
+
+    async def wait(self, name: str):
+        await self.steps[name].done.wait()
+
+    @property
+    def timings(self) -> dict[str, Optional[float]]:
+        return {name: step.duration for name, step in self.steps.items()}
+
+    async def run(self):
+        self._validate()
+
+        self.started_at = time.perf_counter()
+        await asyncio.gather(*(self._run_step(step) for step in self.steps.values()))
+
+        failed = [step.name for step in self.steps.values() if step.failed]
+        elapsed = time.perf_counter() - self.started_at
+        logging.info(f"startup finished in {elapsed:.2f}s" + (f", failed steps: {failed}" if failed else ""))
+
+    def _validate(self):
+        for step in self.steps.values():
+            if missing := [d for d in step.after if d not in self.steps]:
+                raise StartupError(f"step {step.name} depends on unknown steps {missing}")
+
+        # steps of a cycle would wait for each other forever
+        visiting, visited = set(), set()
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise StartupError(f"steps depend on each other in a cycle through {name}")
+
+            visiting.add(name)
+            for dependency in self.steps[name].after:
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.steps:
+            visit(name)
+
+    async def _run_step(self, step: _Step):
+        try:
+            for name in step.after:
+                dependency = self.steps[name]
+                await dependency.done.wait()
+
+                if dependency.failed:
+                    step.failed = True
+                    logging.warning(f"startup step {step.name} skipped, {name} failed")
+                    return
+
+            started = time.perf_counter()
+
+            try:
+                await step.func()
+            except Exception:  # noqa
+                step.failed = True
+                logging.exception(f"startup step {step.name} failed")
+                return
+
+            step.duration = time.perf_counter() - started
+            since_start = time.perf_counter() - self.started_at
+            logging.info(f"startup step {step.name} took {step.duration:.2f}s, done at {since_start:.2f}s")
+        finally:
+            # waiters are released either way, they check failed flag
+            step.done.set()
@@ -6,6 +6,7 @@
 
 from __future__ import annotations
 
+from collections import OrderedDict
 from datetime import datetime
 
 import discord
@@ -52,40 +53,58 @@ waifu_categories = (
 
 
 class AniListMenu(TomodachiMenu):
+    def __init__(self, entries, *, title=None, cache_size: int = 16):
+        super().__init__(entries, title=title)
+        self.cache_size = cache_size
+        # rendered pages, flipping back to one of them only edits the message
+        self._rendered: OrderedDict[tuple[int, int], discord.Embed] = OrderedDict()
+
     async def format_embed(self, media: AniMedia):
-        self.embed.clear_fields()
+        # title of a page shows the total, which can change while paging
+        self.embed = self._rendered[(self.current_index, self.max_index)] = self.render(media)
 
-        media_title = media.title.get("english") or media.title.get("romaji") or media.title.get("native")
-        title = f"{media_title} ({self.current_index + 1}/{self.max_index + 1})"
+        if len(self._rendered) > self.cache_size:
+            self._rendered.popitem(last=False)
 
-        self.embed.title = title
-        self.embed.url = media.url
+    async def update_page(self):
+        key = (self.current_index, self.max_index)
 
-        if media.cover_image.color:
-            self.embed.colour = await commands.ColourConverter().convert(None, media.cover_image.color)
-        else:
-            self.embed.colour = 0x2F3136
+        if (embed := self._rendered.get(key)) is None:
+            return await super().update_page()
 
-        self.embed.description = media.description
-        self.embed.timestamp = media.start_date or discord.Embed.Empty
+        self._rendered.move_to_end(key)
+        self.embed = embed
+        await self.message.edit(embed=embed)
 
-        self.embed.set_image(url=media.banner_image or media.cover_image.large)
+    def render(self, media: AniMedia) -> discord.Embed:
+        embed = discord.Embed(
+            title=f"{media.display_title} ({self.current_index + 1}/{self.max_index + 1})",
+            url=media.url,
+            description=media.description,
+            timestamp=media.start_date or discord.Embed.Empty,
+        )
+        # patched embeds reset the colour passed to the constructor
+        embed.colour = media.cover_image.colour or 0x2F3136
+
+        embed.set_image(url=media.banner_image or media.cover_image.large)
 
         if media.type is MediaType.ANIME:
-            self.embed.add_field(name="Episodes", value=f"`{media.episodes}`")
-            self.embed.add_field(name="Average duration", value=f"`{media.duration}` minutes")
+            embed.add_field(name="Episodes", value=f"`{media.episodes}`")
+            embed.add_field(name="Average duration", value=f"`{media.duration}` minutes")
 
         if media.type is MediaType.MANGA:
-            self.embed.add_field(name="Volumes", value=f"`{media.volumes}`")
-            self.embed.add_field(name="Chapters", value=f"`{media.chapters}`")
+            embed.add_field(name="Volumes", value=f"`{media.volumes}`")
+            embed.add_field(name="Chapters", value=f"`{media.chapters}`")
 
         if media.average_score is not None:
-            self.embed.add_field(name="Average score", value=f"`{media.average_score}%`")
+            embed.add_field(name="Average score", value=f"`{media.average_score}%`")
         else:
-            self.embed.add_field(name="Mean score", value=f"`{media.mean_score}`%")
+            embed.add_field(name="Mean score", value=f"`{media.mean_score}`%")
 
         if media.genres:
-            self.embed.add_field(name="Genres", value=", ".join(media.genres))
+            embed.add_field(name="Genres", value=", ".join(media.genres))
+
+        return embed
 
 
 class TwoDimWorld(commands.Cog, name="2D-World"):
@@ -116,22 +135,22 @@ class TwoDimWorld(commands.Cog, name="2D-World"):
     @commands.command(help="Searches for information about mangas on AniList", description=__anilist_notice)
     async def manga(self, ctx: TomodachiContext, *, query: str):
         async with ctx.typing():
-            data = await AniList.lookup(query, MediaType.MANGA, hide_adult=not ctx.channel.is_nsfw())
-            if not data:
+            pages = await AniList.search(query, MediaType.MANGA, hide_adult=not ctx.channel.is_nsfw())
+            if not pages:
                 return await ctx.send(embed=discord.Embed(title=":x: Nothing was found!"))
 
-            menu = AniListMenu(data)
+            menu = AniListMenu(pages)
             await menu.start(ctx)
 
     @commands.cooldown(1, 7.0, commands.BucketType.user)
     @commands.command(help="Searches for information about animes on AniList", description=__anilist_notice)
     async def anime(self, ctx: TomodachiContext, *, query: str):
         async with ctx.typing():
-            data = await AniList.lookup(query, hide_adult=not ctx.channel.is_nsfw())
-            if not data:
+            pages = await AniList.search(query, hide_adult=not ctx.channel.is_nsfw())
+            if not pages:
                 return await ctx.send(embed=discord.Embed(title=":x: Nothing was found!"))
 
-            menu = AniListMenu(data)
+            menu = AniListMenu(pages)
             await menu.start(ctx)
 
 
@@ -28,7 +28,7 @@ class Default(commands.Cog):
     @config.command(help="Changes prefix of a bot in this server")
     async def prefix(self, ctx: TomodachiContext, new_prefix: str = None):
         if not new_prefix:
-            current_prefix = self.bot.prefixes.get(ctx.guild.id, self.bot.config.DEFAULT_PREFIX)
+            current_prefix = await self.bot.guild_prefix(ctx.guild)
             return await ctx.send(f"Prefix in this server is `{discord.utils.escape_markdown(current_prefix)}`")
 
         prefix = await self.bot.update_prefix(ctx.guild.id, new_prefix)
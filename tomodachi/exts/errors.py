@@ -11,6 +11,7 @@ import discord
 from discord.ext import commands
 
 from tomodachi.core import Tomodachi, TomodachiContext
+from tomodachi.core.exceptions import AniListBusy
 
 
 class ErrorHandler(commands.Cog):
@@ -27,6 +28,7 @@ class ErrorHandler(commands.Cog):
             commands.BadArgument,
             commands.MissingRequiredArgument,
             commands.MaxConcurrencyReached,
+            AniListBusy,
         )
 
     @commands.Cog.listener()
@@ -16,7 +16,7 @@ class Events(commands.Cog):
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild: discord.Guild):
-        await self.bot.pg.store_guild(guild.id)
+        self.bot.pg.register_guild(guild.id)
 
 
 def setup(bot):
@@ -9,10 +9,9 @@ from datetime import datetime
 from typing import Union
 
 import discord
-import humanize
 from discord.ext import commands, flags
 
-from tomodachi.core import Tomodachi, TomodachiContext
+from tomodachi.core import CachedMember, Tomodachi, TomodachiContext
 from tomodachi.utils import make_progress_bar, HUMAN_READABLE_FLAGS, HUMANIZED_ACTIVITY
 
 
@@ -52,7 +51,9 @@ class Info(commands.Cog):
 
     @commands.cooldown(1, 3, commands.BucketType.user)
     @commands.command(aliases=("ui", "memberinfo", "mi"), help="Shows general information about discord users")
-    async def userinfo(self, ctx: TomodachiContext, user: Union[discord.Member, discord.User] = None):
+    async def userinfo(self, ctx: TomodachiContext, user: Union[CachedMember, discord.User] = None):
+        import humanize
+
         # if target user not specified use author
         user = user or ctx.author
 
@@ -98,7 +99,10 @@ class Info(commands.Cog):
 
     @commands.cooldown(1, 3, commands.BucketType.user)
     @commands.command(aliases=("spot",), help="Checks what discord user is listening to")
-    async def spotify(self, ctx, member: discord.Member = None):
+    async def spotify(self, ctx, member: CachedMember = None):
+        if not self.bot.intents.presences:
+            return await ctx.send("Activities are not available, presences are disabled on this instance.")
+
         member = member or ctx.author
         activity = discord.utils.find(lambda a: isinstance(a, discord.Spotify), member.activities)
 
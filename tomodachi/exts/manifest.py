@@ -0,0 +1,61 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+# Commands of extensions that can be loaded on demand, see LAZY_EXTENSIONS in config.
+# This module is not an extension, keep it in sync when commands are added or renamed,
+# a stale entry is reported in logs when its extension gets loaded.
+
+from tomodachi.core.lazy import LazyExtension, StubCommand
+
+__all__ = ["MANIFEST"]
+
+MANIFEST = {
+    "2d_world": LazyExtension(
+        "2D-World",
+        (
+            StubCommand("anipic", help="Finds some waifus for you", usage="[query=waifu]"),
+            StubCommand("manga", help="Searches for information about mangas on AniList", usage="<query>"),
+            StubCommand("anime", help="Searches for information about animes on AniList", usage="<query>"),
+        ),
+    ),
+    "info": LazyExtension(
+        "Info",
+        (
+            StubCommand("avatar", ("avy", "av"), "Provides you an avatar of some discord user", "[user] [--steal]"),
+            StubCommand(
+                "userinfo", ("ui", "memberinfo", "mi"), "Shows general information about discord users", "[user]"
+            ),
+            StubCommand("spotify", ("spot",), "Checks what discord user is listening to", "[member]"),
+        ),
+    ),
+    "tools": LazyExtension(
+        "Tools",
+        (
+            StubCommand("caption", help="Caption an image", usage="[user]"),
+            StubCommand("emoji", ("emote", "e"), "Group of emoji related commands"),
+            StubCommand("tts", help="Transforms text data into speech", usage="<language> <text>"),
+            StubCommand("color", help="Shows information about colours", usage="<color>"),
+        ),
+    ),
+    "owner": LazyExtension(
+        "Owner",
+        (
+            StubCommand("block", usage="<target> [reason]"),
+            StubCommand("unblock", usage="<target>"),
+            StubCommand("caches", help="Shows prefix cache, write queue and rate limiter statistics"),
+            StubCommand("queries", help="Shows call counts and latencies of database queries"),
+            StubCommand(
+                "metrics", help="Shows latencies of commands, or of cogs with 'cogs' argument", usage="[by=commands]"
+            ),
+            StubCommand("stalls", help="Shows the worst event loop stalls, or stack of one of them", usage="[index]"),
+            StubCommand("memory", help="Shows cached discord objects and estimated memory they take"),
+            StubCommand("storage", ("pool",), "Shows storage backend statistics"),
+            StubCommand("clusters", help="Shows guild counts and latencies of every cluster"),
+            StubCommand("steal_avatar", help="Sets someone's avatar as bots' avatar", usage="<user>"),
+        ),
+        owner_only=True,
+    ),
+}
@@ -9,16 +9,20 @@ from __future__ import annotations
 import asyncio
 
 import discord
-from asyncpg.exceptions import UniqueViolationError
 from discord.ext import commands
 
 from tomodachi.core import Tomodachi, TomodachiContext
+from tomodachi.utils.memory import peak_rss
 
 
 class Owner(commands.Cog):
     def __init__(self, bot: Tomodachi):
         self.bot = bot
-        self.deletion_emoji_detector = bot.icon("fuck")
+
+    @property
+    def deletion_emoji_detector(self):
+        # icons are set up after the cog is loaded
+        return self.bot.icon("fuck")
 
     async def cog_check(self, ctx: TomodachiContext):
         return await self.bot.is_owner(ctx.author)
@@ -34,20 +38,156 @@ class Owner(commands.Cog):
 
     @commands.command()
     async def block(self, ctx: TomodachiContext, target: discord.User, *, reason: str = None):
-        try:
-            await self.bot.pg.block(target.id, reason or "No reason")
-        except UniqueViolationError:
-            await ctx.send("user is blocked already")
-        else:
-            await self.bot.fetch_blacklist()
-            await ctx.send(":ok_hand:")
+        if not await self.bot.pg.block(target.id, reason or "No reason"):
+            return await ctx.send("user is blocked already")
+
+        await ctx.send(":ok_hand:")
 
     @commands.command()
     async def unblock(self, ctx: TomodachiContext, target: discord.User):
         await self.bot.pg.unblock(target.id)
-        await self.bot.fetch_blacklist()
         await ctx.send(":ok_hand:")
 
+    @commands.command(help="Shows prefix cache, write queue and rate limiter statistics")
+    async def caches(self, ctx: TomodachiContext):
+        stats = self.bot.prefixes.stats
+        lookups = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / lookups if lookups else 0.0
+
+        embed = discord.Embed(title="Prefix cache")
+        embed.description = "\n".join(f"{k}: `{v}`" for k, v in stats.items())
+        embed.add_field(name="Hit ratio", value=f"`{ratio:.2%}`")
+
+        mode = "write-behind" if self.bot.pg.write_behind else "direct"
+        writes = "\n".join(f"{k}: `{v}`" for k, v in self.bot.pg.writes.stats.items())
+        embed.add_field(name=f"Write queue ({mode})", value=writes, inline=False)
+
+        if limits := self.bot.global_rate_limit.stats:
+            value = "\n".join(f"{k}: `{v}`" for k, v in limits.items())
+            embed.add_field(name="Global rate limit", value=value, inline=False)
+
+        value = "\n".join(f"{k}: `{v}`" for k, v in self.bot.chunker.stats.items())
+        embed.add_field(name="Member chunker", value=value, inline=False)
+
+        from tomodachi.utils.apis import AniList
+
+        parts = (
+            ("AniList governor", AniList.governor),
+            ("AniList batches", AniList.batcher),
+            ("AniList store", AniList.store),
+        )
+        for name, part in parts:
+            if part is not None:
+                value = "\n".join(f"{k}: `{v}`" for k, v in part.stats.items())
+                embed.add_field(name=name, value=value)
+
+        for cache in self.bot.caches.values():
+            value = "\n".join(f"{k}: `{v}`" for k, v in cache.stats.items() if k != "namespace")
+            embed.add_field(name=f"Cache {cache.namespace}", value=value)
+
+        if shared := self.bot.cache_backend.stats:
+            value = "\n".join(f"{k}: `{v}`" for k, v in shared.items())
+            embed.add_field(name=f"Shared cache ({self.bot.cache_backend.name})", value=value, inline=False)
+
+        await ctx.send(embed=embed)
+
+    @commands.command(help="Shows call counts and latencies of database queries")
+    async def queries(self, ctx: TomodachiContext):
+        lines = [f"{'query':<16} {'calls':>7} {'errors':>6} {'p50':>7} {'p95':>7} {'p99':>7}"]
+
+        for q in sorted(self.bot.pg.queries, key=lambda q: q.histogram.total, reverse=True):
+            h = q.histogram
+            p50, p95, p99 = (h.quantile(x) * 1000 for x in (0.5, 0.95, 0.99))
+            lines.append(f"{q.name:<16} {q.calls:>7} {q.errors:>6} {p50:>7.1f} {p95:>7.1f} {p99:>7.1f}")
+
+        table = "\n".join(lines)
+        await ctx.send(f"Latencies are in milliseconds\n```\n{table}\n```")
+
+    @commands.command(help="Shows latencies of commands, or of cogs with 'cogs' argument")
+    async def metrics(self, ctx: TomodachiContext, by: str = "commands"):
+        stats = self.bot.metrics.by_cog() if by == "cogs" else list(self.bot.metrics)
+        stats.sort(key=lambda s: s.latency.total, reverse=True)
+
+        header = ("name", "calls", "err", "p50", "p95", "p99", "http", "db", "dapi")
+        lines = ["{:<14} {:>6} {:>4} {:>7} {:>7} {:>7} {:>6} {:>6} {:>6}".format(*header)]
+
+        # the slowest ones in total fit into a single message
+        for s in stats[:20]:
+            h = s.latency
+            p50, p95, p99 = (h.quantile(x) * 1000 for x in (0.5, 0.95, 0.99))
+            http, db, dapi = (s.waits[k].mean * 1000 for k in ("http", "db", "discord"))
+            lines.append(
+                f"{s.name[:14]:<14} {s.calls:>6} {s.errors:>4} {p50:>7.1f} {p95:>7.1f} {p99:>7.1f} "
+                f"{http:>6.1f} {db:>6.1f} {dapi:>6.1f}"
+            )
+
+        table = "\n".join(lines)
+        await ctx.send(f"Latencies are in milliseconds, waits are mean per call\n```\n{table}\n```")
+
+    @commands.command(help="Shows the worst event loop stalls, or stack of one of them")
+    async def stalls(self, ctx: TomodachiContext, index: int = None):
+        if (watchdog := self.bot.watchdog) is None:
+            return await ctx.send("loop watchdog is disabled")
+
+        worst = watchdog.worst_stalls()
+
+        if index is not None:
+            if not 0 < index <= len(worst):
+                return await ctx.send(f"there are {len(worst)} stalls recorded")
+
+            stall = worst[index - 1]
+            # the innermost frames are the interesting ones
+            stack = "".join(stall.stack)[-1800:]
+            return await ctx.send(f"`{stall.duration * 1000:.0f}ms` in `{stall.command}`\n```py\n{stack}\n```")
+
+        lines = [f"{'#':>2} {'ms':>7} {'command':<14} {'task':<20}"]
+        for i, stall in enumerate(worst[:15], start=1):
+            command, task = str(stall.command)[:14], str(stall.task)[:20]
+            lines.append(f"{i:>2} {stall.duration * 1000:>7.0f} {command:<14} {task:<20}")
+
+        stats = ", ".join(f"{k}: `{v}`" for k, v in watchdog.stats.items())
+        table = "\n".join(lines)
+        await ctx.send(f"{stats}\n```\n{table}\n```")
+
+    @commands.command(help="Shows cached discord objects and estimated memory they take")
+    async def memory(self, ctx: TomodachiContext):
+        usage = await self.bot.cache_usage()
+        peak = peak_rss()
+
+        lines = [f"{'cache':<10} {'count':>9} {'estimate':>11}"]
+        for name, count, size in usage:
+            lines.append(f"{name:<10} {count:>9} {size / 1024 ** 2:>9.1f}MB")
+
+        table = "\n".join(lines)
+        total = sum(u.bytes for u in usage) / 1024 ** 2
+        await ctx.send(
+            f"Profile: `{self.bot.cache_profile.name}`, estimated total: `{total:.1f}MB`, "
+            f"peak RSS: `{'unknown' if peak is None else f'{peak:.1f}MB'}`\n```\n{table}\n```"
+        )
+
+    @commands.command(aliases=("pool",), help="Shows storage backend statistics")
+    async def storage(self, ctx: TomodachiContext):
+        backend = self.bot.pg.backend
+
+        embed = discord.Embed(title=f"Storage ({backend.name})")
+        embed.description = "\n".join(f"{k}: `{v}`" for k, v in backend.stats.items())
+
+        await ctx.send(embed=embed)
+
+    @commands.command(help="Shows guild counts and latencies of every cluster")
+    async def clusters(self, ctx: TomodachiContext):
+        guilds = await self.bot.cluster_query("guild_count")
+        latencies = await self.bot.cluster_query("latency")
+
+        lines = [f"{'cluster':<8} {'guilds':>8} {'latency':>9}"]
+        for cluster_id in sorted(guilds):
+            latency = latencies.get(cluster_id)
+            latency = f"{latency * 1000:.0f}ms" if latency is not None else "-"
+            lines.append(f"{cluster_id:<8} {guilds[cluster_id] or 0:>8} {latency:>9}")
+
+        table = "\n".join(lines)
+        await ctx.send(f"Total guilds: `{sum(g or 0 for g in guilds.values())}`\n```\n{table}\n```")
+
     @commands.command()
     async def steal_avatar(self, ctx: TomodachiContext, user: discord.User):
         """Sets someone's avatar as bots' avatar"""
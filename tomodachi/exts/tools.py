@@ -8,11 +8,8 @@ import io
 from typing import Union
 
 import discord
-import more_itertools as miter
-from PIL import Image
 from aiohttp import ClientResponseError
 from discord.ext import commands
-from gtts import gTTS
 
 from tomodachi.core import Tomodachi, TomodachiContext, TomodachiMenu
 from tomodachi.utils import to_thread
@@ -27,6 +24,9 @@ class Tools(commands.Cog):
     @staticmethod
     @to_thread
     def make_color_circle(color):
+        # heavy dependencies are imported on first use, not with the extension
+        from PIL import Image
+
         buff = io.BytesIO()
 
         with Image.new("RGB", (256, 256), color) as im:
@@ -38,6 +38,8 @@ class Tools(commands.Cog):
     @staticmethod
     @to_thread
     def make_text_to_speech(lang, text):
+        from gtts import gTTS
+
         buff = io.BytesIO()
 
         tts = gTTS(text=text, lang=lang)
@@ -92,6 +94,8 @@ class Tools(commands.Cog):
     @commands.cooldown(1, 10.0, commands.BucketType.channel)
     @emoji.command(name="list", aliases=("ls",), help="Spawns a menu with a list of emojis of this server")
     async def emoji_list(self, ctx: TomodachiContext):
+        import more_itertools as miter
+
         lines_chunks = miter.chunked([f"{e} | `{e}`" for e in ctx.guild.emojis], 10)
         pages = ["\n".join(lines) for lines in lines_chunks]
 
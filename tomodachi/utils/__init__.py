@@ -4,8 +4,21 @@
 #  License, v. 2.0. If a copy of the MPL was not distributed with this
 #  file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
-from .apis import *
+from .cache import *
 from .decos import *
 from .factories import *
+from .instrumentation import *
 from .pgsql import pg
+from .ratelimit import *
+from .singleflight import *
 from .text import *
+
+
+def __getattr__(name):
+    # api clients are imported on first access, most processes never touch them
+    if name in ("AniList", "AniMedia", "MediaType"):
+        from . import apis
+
+        return getattr(apis, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
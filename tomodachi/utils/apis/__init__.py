@@ -5,3 +5,5 @@
 #  file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 from .anilist import *
+from .governor import *
+from .pagestore import *
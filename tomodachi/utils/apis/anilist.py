@@ -6,15 +6,27 @@
 
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import functools
+import html
+import json
+import logging
+import re
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Optional, ClassVar, TypedDict
+from typing import ClassVar, NamedTuple, Optional, TypedDict
 
 from aiohttp import ClientSession
 
-from tomodachi.core.exceptions import AniListException
+from tomodachi.core.exceptions import AniListBusy, AniListException
+from tomodachi.utils.cache import JSON, MemoryCacheBackend, TieredCache
+from tomodachi.utils.ratelimit import RateLimiter
 
-__all__ = ["AniList", "AniMedia", "MediaType"]
+from .governor import RequestBatcher, RequestGovernor, _float
+from .pagestore import PageStore
+
+__all__ = ["AniList", "AniMedia", "MediaType", "MediaPage", "MediaPages"]
 
 
 class MediaType(Enum):
@@ -29,96 +41,123 @@ class MediaTitle(TypedDict):
 
 
 class MediaCoverImage:
-    __slots__ = ("extra_large", "large", "medium", "color")
+    __slots__ = ("extra_large", "large", "medium", "color", "colour")
 
     def __init__(self, **kwargs):
-        self.extra_large = kwargs.get("extraLarge")
-        self.large = kwargs.get("large")
-        self.medium = kwargs.get("medium")
-        self.color = kwargs.get("color")
+        self.extra_large: Optional[str] = kwargs.get("extraLarge")
+        self.large: Optional[str] = kwargs.get("large")
+        self.medium: Optional[str] = kwargs.get("medium")
+        self.color: Optional[str] = kwargs.get("color")
+        # "#rrggbb" as an int that embeds take
+        self.colour: Optional[int] = int(self.color[1:], 16) if self.color else None
+
+
+# anilist sends descriptions as html, embeds take markdown
+_DESCRIPTION_MARKUP = (
+    (re.compile(r"\n"), ""),
+    (re.compile(r"<br\s*/?>", re.IGNORECASE), "\n"),
+    (re.compile(r"</?(i|em)>", re.IGNORECASE), "*"),
+    (re.compile(r"</?(b|strong)>", re.IGNORECASE), "**"),
+    (re.compile(r"<[^>]+>"), ""),
+    (re.compile(r"\n{3,}"), "\n\n"),
+)
+# description limit of discord embeds
+_DESCRIPTION_LIMIT = 2048
+
+
+def clean_description(description: Optional[str]) -> str:
+    if not description:
+        return ""
+
+    for pattern, replacement in _DESCRIPTION_MARKUP:
+        description = pattern.sub(replacement, description)
+
+    description = html.unescape(description).strip()
+
+    if len(description) > _DESCRIPTION_LIMIT:
+        description = description[: _DESCRIPTION_LIMIT - 1] + "\N{HORIZONTAL ELLIPSIS}"
+
+    return description
 
 
 class AniMedia:
+    """AniList media record, parsed once into what embeds need."""
+
     __slots__ = (
         "id",
         "title",
-        "_type",
-        "_description",
+        "display_title",
+        "type",
+        "description",
         "genres",
         "duration",
-        "_startDate",
+        "start_date",
         "mean_score",
         "average_score",
         "status",
-        "_coverImage",
+        "cover_image",
         "banner_image",
         "url",
         "episodes",
-        "_is_adult",
+        "is_adult",
         "volumes",
         "chapters",
     )
 
     def __init__(self, **kwargs):
         self.id: int = kwargs.get("id")
-        self.title: MediaTitle = kwargs.get("title", {})
-        self._type: str = kwargs.get("type")
-        self._description: str = kwargs.get("description")
-        self.genres: list[str] = kwargs.get("genres", [])
+        self.title: MediaTitle = kwargs.get("title") or {}
+        self.display_title: Optional[str] = (
+            self.title.get("english") or self.title.get("romaji") or self.title.get("native")
+        )
+        self.type: MediaType = MediaType(kwargs.get("type"))
+        self.description: str = clean_description(kwargs.get("description"))
+        self.genres: tuple[str, ...] = tuple(kwargs.get("genres") or ())
         self.duration: int = kwargs.get("duration", 0)
-        self._startDate: dict[str, int] = kwargs.get("startDate", {})
+        self.start_date: Optional[datetime] = self._parse_date(kwargs.get("startDate"))
         self.mean_score: int = kwargs.get("meanScore", 0)
         self.average_score: Optional[int] = kwargs.get("averageScore", 0)
         self.status: str = kwargs.get("status")
-        self._coverImage: dict[str, str] = kwargs.get("coverImage")
-        self.banner_image: str = kwargs.get("bannerImage")
+        self.cover_image: MediaCoverImage = MediaCoverImage(**(kwargs.get("coverImage") or {}))
+        self.banner_image: Optional[str] = kwargs.get("bannerImage")
         self.url: str = kwargs.get("siteUrl")
         self.episodes: int = kwargs.get("episodes")
-        self._is_adult: bool = kwargs.get("isAdult", False)
+        self.is_adult: bool = kwargs.get("isAdult", False)
         self.volumes: Optional[int] = kwargs.get("volumes", 0)
         self.chapters: Optional[int] = kwargs.get("chapters", 0)
 
     def __repr__(self):
         return f"<AniMedia id={self.id} title={self.title}>"
 
-    @property
-    def type(self):
-        return MediaType(self._type)
-
-    @property
-    def description(self):
-        # absolute genius move here
-        return self._description.replace("\n", "").replace("<br>", "\n")
-
-    @property
-    def start_date(self):
-        if any(n is None for n in self._startDate.values()):
+    @staticmethod
+    def _parse_date(date: Optional[dict[str, int]]) -> Optional[datetime]:
+        if not date or any(date.get(k) is None for k in ("year", "month", "day")):
             return None
 
-        return datetime(self._startDate["year"], self._startDate["month"], self._startDate["day"], tzinfo=timezone.utc)
+        return datetime(date["year"], date["month"], date["day"], tzinfo=timezone.utc)
 
-    @property
-    def cover_image(self):
-        return MediaCoverImage(**self._coverImage)
 
-    @property
-    def is_adult(self):
-        return self._is_adult
+def normalize_search(search: str) -> str:
+    return " ".join(search.casefold().split())
 
 
 class AniList:
     __base_url: ClassVar[str] = "https://graphql.anilist.co"
     __session: ClassVar[Optional[ClientSession]] = None
 
-    @classmethod
-    async def setup(cls, session):
-        cls.__session = session
+    # replaced by the bot's cache in setup, which can be shared between processes.
+    # pages are cached as the json anilist sent, parsed objects don't survive a change of their classes
+    cache: ClassVar[TieredCache] = TieredCache(
+        "anilist", MemoryCacheBackend(), ttl=900.0, local_ttl=900.0, serializer=JSON
+    )
 
-    @classmethod
-    async def lookup(cls, search: str, _type: MediaType = MediaType.ANIME, *, raw=False, hide_adult=True):
-        query = """
-                query ($id: Int, $page: Int, $search: String, $type: MediaType) {
-                  Page(page: $page, perPage: 100) {
+    governor: ClassVar[Optional[RequestGovernor]] = None
+    batcher: ClassVar[Optional[RequestBatcher]] = None
+    store: ClassVar[Optional[PageStore]] = None
+
+    # selection of a single page, variables get a suffix per alias when pages are batched
+    __page: ClassVar[str] = """
+                  Page(page: $page, perPage: $perPage) {
                     pageInfo {
                       total
                       currentPage
@@ -126,7 +165,8 @@ class AniList:
                       hasNextPage
                       perPage
                     }
-                    media(id: $id, search: $search, type: $type, sort: POPULARITY_DESC) {
+                    media(search: $search, type: $type, isAdult: $isAdult, genre_not_in: $genreNotIn,
+                          sort: POPULARITY_DESC) {
                       type
                       id
                       title {
@@ -159,29 +199,230 @@ class AniList:
                       chapters
                     }
                   }
-                }
-        """
+    """
+    __variables: ClassVar[dict[str, str]] = {
+        "page": "Int",
+        "perPage": "Int",
+        "search": "String",
+        "type": "MediaType",
+        "isAdult": "Boolean",
+        "genreNotIn": "[String]",
+    }
+
+    @classmethod
+    async def setup(
+        cls,
+        session,
+        *,
+        cache: Optional[TieredCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_waiting: int = 50,
+        deadline: float = 10.0,
+        batch_window: float = 0.05,
+        batch_size: int = 8,
+        store: Optional[PageStore] = None,
+    ):
+        cls.__session = session
+        cls.store = store
 
+        if cache is not None:
+            cls.cache = cache
+
+        if rate_limiter is not None:
+            cls.governor = RequestGovernor(rate_limiter, max_waiting=max_waiting, deadline=deadline)
+
+        cls.batcher = RequestBatcher(cls._send_batch, window=batch_window, max_size=batch_size)
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def _document(cls, size: int) -> str:
+        """Query with ``size`` pages aliased as q0, q1 and so on."""
+        declarations = ", ".join(f"${name}_{i}: {t}" for i in range(size) for name, t in cls.__variables.items())
+        pages = "".join(f"q{i}: " + re.sub(r"\$(\w+)", rf"$\1_{i}", cls.__page).strip() + "\n" for i in range(size))
+
+        return f"query ({declarations}) {{\n{pages}}}"
+
+    @staticmethod
+    def _variables(search: str, _type: MediaType, *, page: int, per_page: int, hide_adult: bool):
         variables = {
             "type": _type.name,
             "search": search,
-            "page": 1,
+            "page": page,
+            "perPage": per_page,
         }
 
-        response = await cls.__session.post(cls.__base_url, json={"query": query, "variables": variables})
-        _json = await response.json()
+        # filtering on anilist's side keeps pages full and their total right
+        if hide_adult:
+            variables.update(isAdult=False, genreNotIn=["Hentai"])
+
+        return variables
+
+    @classmethod
+    async def _post(cls, query: str, variables: dict, *, attempts=3) -> dict:
+        for attempt in range(1, attempts + 1):
+            if cls.governor is not None:
+                await cls.governor.acquire()
+
+            response = await cls.__session.post(cls.__base_url, json={"query": query, "variables": variables})
+            body = await response.read()
+
+            if cls.governor is None:
+                break
+
+            cls.governor.observe(response.status, response.headers)
+
+            # the governor holds the next attempt until the limit resets, or gives up
+            if response.status != 429 or attempt == attempts:
+                break
+
+        if response.status == 429:
+            # a malformed header must not turn a busy api into a crash of the command
+            raise AniListBusy(_float(response.headers.get("Retry-After")) or 60.0)
+
+        return json.loads(body)
+
+    @classmethod
+    async def _send_batch(cls, batch: list[dict]) -> list:
+        variables = {f"{name}_{i}": value for i, v in enumerate(batch) for name, value in v.items()}
+        _json = await cls._post(cls._document(len(batch)), variables)
+        data = _json.get("data") or {}
+
+        return [data.get(f"q{i}") or AniListException(_json) for i in range(len(batch))]
+
+    @staticmethod
+    def _parse_page(data: dict, page: int, per_page: int) -> MediaPage:
+        info = data["pageInfo"]
 
-        if "errors" in _json.keys():
-            raise AniListException(_json)
+        media = tuple(AniMedia(**obj) for obj in data["media"])
+        # total anilist reports is an estimate, it's exact once the last page is known
+        total = info["total"] if info["hasNextPage"] else (page - 1) * per_page + len(media)
 
+        return MediaPage(media, total, info["hasNextPage"])
+
+    @classmethod
+    async def _fetch_page(cls, key: str, search: str, _type: MediaType, hide_adult: bool, page: int, per_page: int):
+        if cls.store is None or (data := await cls.store.get(key)) is None:
+            variables = cls._variables(search, _type, page=page, per_page=per_page, hide_adult=hide_adult)
+            data = await cls.batcher.submit(variables)
+
+            if cls.store is not None:
+                cls.store.put(key, data)
+
+        return data
+
+    @classmethod
+    async def page(cls, search: str, _type: MediaType, *, page=1, per_page=100, hide_adult=True) -> MediaPage:
+        # the same popular titles are searched over and over in different guilds
+        key = json.dumps([normalize_search(search), _type.name, hide_adult, page, per_page], separators=(",", ":"))
+        data = await cls.cache.get_or_load(key, lambda: cls._fetch_page(key, search, _type, hide_adult, page, per_page))
+
+        return cls._parse_page(data, page, per_page)
+
+    @classmethod
+    async def lookup(cls, search: str, _type: MediaType = MediaType.ANIME, *, raw=False, hide_adult=True):
         if raw:
+            variables = cls._variables(search, _type, page=1, per_page=100, hide_adult=hide_adult)
+            _json = await cls._post(cls._document(1), {f"{k}_0": v for k, v in variables.items()})
+
+            if "errors" in _json.keys():
+                raise AniListException(_json)
+
+            _json["data"] = {"Page": _json["data"]["q0"]}
             return _json
 
-        if hide_adult:
-            return [
-                AniMedia(**obj)
-                for obj in _json["data"]["Page"]["media"]
-                if (obj["isAdult"] is False and "Hentai" not in obj["genres"])
-            ]
-        else:
-            return [AniMedia(**obj) for obj in _json["data"]["Page"]["media"]]
+        page = await cls.page(search, _type, hide_adult=hide_adult)
+        return list(page.media)
+
+    @classmethod
+    async def search(cls, search: str, _type: MediaType = MediaType.ANIME, *, hide_adult=True, per_page=5):
+        """Returns pages of the search results, only the first one is fetched right away."""
+        first = await cls.page(search, _type, per_page=per_page, hide_adult=hide_adult)
+        return MediaPages(search, _type, first, per_page=per_page, hide_adult=hide_adult)
+
+
+class MediaPage(NamedTuple):
+    media: tuple[AniMedia, ...]
+    total: int
+    has_next: bool
+
+
+class MediaPages:
+    """Results of a search that are fetched page by page as they are accessed.
+
+    The next page is requested in the background once one of the last ``prefetch``
+    entries of a page is accessed.
+    """
+
+    def __init__(
+        self, search: str, _type: MediaType, first: MediaPage, *, per_page: int, hide_adult: bool, prefetch: int = 2
+    ):
+        self.search = search
+        self.type = _type
+        self.per_page = per_page
+        self.hide_adult = hide_adult
+        self.prefetch = prefetch
+
+        self.total = first.total
+        self._pages: dict[int, MediaPage] = {1: first}
+        self._prefetching: dict[int, asyncio.Task] = {}
+
+    def __len__(self):
+        return self.total
+
+    def __repr__(self):
+        return f"<MediaPages search={self.search!r} total={self.total} fetched={sorted(self._pages)}>"
+
+    async def get(self, index: int) -> AniMedia:
+        if not 0 <= index < self.total:
+            raise IndexError(index)
+
+        number, offset = divmod(index, self.per_page)
+        page = await self._page(number + 1)
+
+        if page.has_next and offset >= self.per_page - self.prefetch:
+            self._start_prefetch(number + 2)
+
+        if offset >= len(page.media):
+            # anilist's estimate was too high, the last page ends earlier
+            self.total = number * self.per_page + len(page.media)
+            raise IndexError(index)
+
+        return page.media[offset]
+
+    async def _page(self, number: int) -> MediaPage:
+        if (page := self._pages.get(number)) is not None:
+            return page
+
+        if (task := self._prefetching.get(number)) is not None:
+            # a failed prefetch is retried below
+            with contextlib.suppress(Exception):
+                await asyncio.shield(task)
+
+        if number not in self._pages:
+            await self._fetch(number)
+
+        return self._pages[number]
+
+    async def _fetch(self, number: int):
+        page = await AniList.page(
+            self.search, self.type, page=number, per_page=self.per_page, hide_adult=self.hide_adult
+        )
+        self._pages[number] = page
+
+        if not page.has_next:
+            self.total = (number - 1) * self.per_page + len(page.media)
+
+    def _start_prefetch(self, number: int):
+        if number in self._pages or number in self._prefetching:
+            return
+
+        task = self._prefetching[number] = asyncio.create_task(self._fetch(number))
+        task.add_done_callback(self._prefetched)
+
+    def _prefetched(self, task: asyncio.Task):
+        for number, t in list(self._prefetching.items()):
+            if t is task:
+                del self._prefetching[number]
+
+        if not task.cancelled() and (e := task.exception()) is not None:
+            logging.warning(f"prefetching AniList page failed: {e!r}")
@@ -0,0 +1,195 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable, Mapping, Optional
+
+from tomodachi.core.exceptions import AniListBusy
+from tomodachi.utils.ratelimit import RateLimiter
+
+__all__ = ["RequestGovernor", "RequestBatcher"]
+
+
+class RequestGovernor:
+    """Paces requests to an API with a rate limiter and the rate limit headers of its responses.
+
+    Requests wait for their turn in order, at most ``max_waiting`` of them at once.
+    A request that can't be sent within ``deadline`` seconds fails right away
+    with ``AniListBusy`` instead of waiting in vain.
+    """
+
+    def __init__(self, limiter: RateLimiter, *, key: Hashable = 0, max_waiting: int = 50, deadline: float = 10.0):
+        self.limiter = limiter
+        self.key = key
+        self.max_waiting = max_waiting
+        self.deadline = deadline
+
+        self._lock = asyncio.Lock()
+        self._waiting = 0
+        # monotonic time until which the API asked us to stop
+        self._blocked_until = 0.0
+
+        self.granted = 0
+        self.rejected = 0
+        self.throttled = 0
+
+    @property
+    def stats(self):
+        return {
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "throttled": self.throttled,
+            "waiting": self._waiting,
+            "blocked_for": round(max(self._blocked_until - time.monotonic(), 0.0), 2),
+        }
+
+    async def acquire(self):
+        if self._waiting >= self.max_waiting:
+            self.rejected += 1
+            raise AniListBusy(self.limiter.interval * self._waiting)
+
+        deadline = time.monotonic() + self.deadline
+        self._waiting += 1
+
+        try:
+            await self._acquire(deadline)
+        finally:
+            self._waiting -= 1
+
+    async def _acquire(self, deadline: float):
+        try:
+            await asyncio.wait_for(self._lock.acquire(), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise AniListBusy(self.deadline) from None
+
+        try:
+            while True:
+                now = time.monotonic()
+
+                # the rate limiter is not hit while blocked, it would only waste its budget
+                if not (wait := self._blocked_until - now) > 0:
+                    if not (wait := await self.limiter.hit(self.key)):
+                        break
+
+                if now + wait > deadline:
+                    self.rejected += 1
+                    raise AniListBusy(wait)
+
+                await asyncio.sleep(wait)
+        finally:
+            self._lock.release()
+
+        self.granted += 1
+
+    def observe(self, status: int, headers: Mapping[str, str]):
+        """Blocks further requests for as long as the response tells to."""
+        retry_after = _float(headers.get("Retry-After"))
+        remaining = _float(headers.get("X-RateLimit-Remaining"))
+
+        if status == 429:
+            self.throttled += 1
+            # without retry-after there is no better guess than a whole window of the limiter
+            self._block(retry_after if retry_after is not None else self.limiter.per)
+
+        elif remaining is not None and remaining < 1:
+            reset = _float(headers.get("X-RateLimit-Reset"))
+            self._block(reset - time.time() if reset is not None else self.limiter.interval)
+
+    def _block(self, seconds: float):
+        if seconds <= 0:
+            return
+
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        logging.info(f"requests are paused for {seconds:.1f}s by rate limit of the API")
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestBatcher:
+    """Collects requests made within ``window`` seconds and sends them together.
+
+    ``send`` receives a list of requests and returns a result for each of them,
+    a result that is an exception is raised to the caller that made the request.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[list[Any]], Awaitable[list[Any]]],
+        *,
+        window: float = 0.05,
+        max_size: int = 8,
+    ):
+        self._send = send
+        self.window = window
+        self.max_size = max_size
+
+        self._queue: list[tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.batches = 0
+        self.requests = 0
+        self.largest = 0
+
+    @property
+    def stats(self):
+        average = self.requests / self.batches if self.batches else 0.0
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "average": round(average, 2),
+            "largest": self.largest,
+        }
+
+    async def submit(self, request: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((request, future))
+
+        if len(self._queue) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._queue = self._queue, []
+        if batch:
+            asyncio.create_task(self._run(batch))
+
+    async def _run(self, batch: list[tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.requests += len(batch)
+        self.largest = max(self.largest, len(batch))
+
+        try:
+            results = await self._send([request for request, _future in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_request, future), result in zip(batch, results):
+            # the caller might have been cancelled meanwhile
+            if future.done():
+                continue
+
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,243 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+__all__ = ["PageStore"]
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS pages_expires_at ON pages (expires_at);
+"""
+
+
+class PageStore:
+    """Responses of AniList kept in a local SQLite file, so they survive restarts.
+
+    Only the writer stores new responses and removes expired ones, processes that share
+    the file on the same host open it read-only. The file is opened on the first use.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        ttl: float = 86400.0,
+        writer: bool = True,
+        max_entries: int = 100_000,
+        flush_interval: float = 1.0,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.writer = writer
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+
+        self.__conn_: Optional[sqlite3.Connection] = None
+        self.__executor_ = ThreadPoolExecutor(max_workers=1, thread_name_prefix="anilist-store")
+        # a reader can't create the file, it tries again after a while
+        self._retry_at = 0.0
+
+        # key -> (body, expiration time)
+        self._pending: dict[str, tuple[bytes, float]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._compaction_task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.removed = 0
+        self.errors = 0
+
+    @property
+    def stats(self):
+        return {
+            "path": self.path,
+            "role": "writer" if self.writer else "reader",
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "pending": len(self._pending),
+            "removed": self.removed,
+            "errors": self.errors,
+        }
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor_, functools.partial(func, *args))
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self.__conn_ is not None or time.monotonic() < self._retry_at:
+            return self.__conn_
+
+        try:
+            if self.writer:
+                conn = sqlite3.connect(self.path, isolation_level=None)
+                conn.execute("PRAGMA journal_mode = WAL;")
+                conn.execute("PRAGMA synchronous = NORMAL;")
+                conn.executescript(SCHEMA)
+            else:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, isolation_level=None)
+                conn.execute("SELECT 1 FROM pages LIMIT 1;")
+        except sqlite3.Error as e:
+            self.errors += 1
+            self._retry_at = time.monotonic() + 60.0
+            logging.warning(f"anilist store at {self.path} is unavailable: {e}")
+            return None
+
+        logging.info(f"anilist store opened at {self.path} as {'writer' if self.writer else 'reader'}")
+        self.__conn_ = conn
+        return conn
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Returns decoded response stored under the key, or None."""
+        if (pending := self._pending.get(key)) is not None:
+            body, _expires_at = pending
+        elif (body := await self._run(self._select, key)) is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(body)
+
+    def _select(self, key: str) -> Optional[bytes]:
+        if (conn := self._connection()) is None:
+            return None
+
+        try:
+            row = conn.execute("SELECT body FROM pages WHERE key = ? AND expires_at > ?;", (key, time.time())).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.warning(f"reading anilist store failed: {e}")
+            return None
+
+        return row[0] if row is not None else None
+
+    def put(self, key: str, value: Any):
+        """Schedules the response to be written, does nothing in read-only processes."""
+        if not self.writer:
+            return
+
+        self._pending[key] = (json.dumps(value).encode(), time.time() + self.ttl)
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+        finally:
+            self._flush_task = None
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        rows = [(key, body, expires_at) for key, (body, expires_at) in self._pending.items()]
+        self._pending.clear()
+
+        await self._run(self._insert, rows)
+
+    def _insert(self, rows: list[tuple[str, bytes, float]]):
+        if (conn := self._connection()) is None:
+            return
+
+        def insert(c: sqlite3.Connection):
+            c.executemany("INSERT OR REPLACE INTO pages (key, body, expires_at) VALUES (?, ?, ?);", rows)
+
+        try:
+            self._transaction(conn, insert)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.warning(f"writing {len(rows)} pages to anilist store failed: {e}")
+        else:
+            self.writes += len(rows)
+
+    @staticmethod
+    def _transaction(conn: sqlite3.Connection, func: Callable[[sqlite3.Connection], T]) -> T:
+        conn.execute("BEGIN;")
+
+        try:
+            result = func(conn)
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+        else:
+            conn.execute("COMMIT;")
+            return result
+
+    def _compact(self):
+        if (conn := self._connection()) is None:
+            return
+
+        def delete(c: sqlite3.Connection):
+            expired = c.execute("DELETE FROM pages WHERE expires_at <= ?;", (time.time(),)).rowcount
+            # the ones closest to expiration go first once there are too many
+            trimmed = c.execute(
+                "DELETE FROM pages WHERE key IN (SELECT key FROM pages ORDER BY expires_at DESC LIMIT -1 OFFSET ?);",
+                (self.max_entries,),
+            ).rowcount
+            return expired, trimmed
+
+        expired, trimmed = self._transaction(conn, delete)
+
+        self.removed += expired + trimmed
+
+        # keeps the log from growing while readers come and go
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+        if expired + trimmed:
+            logging.info(f"anilist store compacted, {expired} expired and {trimmed} trimmed pages removed")
+
+    def start_compaction(self, *, interval: float = 3600.0):
+        """Removes expired pages every ``interval`` seconds until the store is closed."""
+        if self.writer and self._compaction_task is None:
+            self._compaction_task = asyncio.create_task(self._run_compaction(interval))
+
+    async def _run_compaction(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+
+            try:
+                await self._run(self._compact)
+            except sqlite3.Error as e:
+                self.errors += 1
+                logging.warning(f"compacting anilist store failed: {e}")
+
+    async def close(self):
+        for task in (self._compaction_task, self._flush_task):
+            if task is not None:
+                task.cancel()
+
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+
+        # pending pages of a cancelled delayed flush are written here
+        await self.flush()
+
+        if self.__conn_ is not None:
+            await self._run(self.__conn_.close)
+
+        # nothing is queued anymore, there is no need to block the loop on joining the thread
+        self.__executor_.shutdown(wait=False)
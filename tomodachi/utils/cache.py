@@ -0,0 +1,398 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import functools
+import importlib
+import json
+import logging
+import pickle
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable, NamedTuple, Optional, Sequence
+
+from .singleflight import SingleFlight
+
+__all__ = [
+    "Serializer",
+    "JSON",
+    "PICKLE",
+    "CacheBackend",
+    "MemoryCacheBackend",
+    "RedisCacheBackend",
+    "TieredCache",
+    "make_cache_backend",
+]
+
+_MISSING = object()
+
+
+class Serializer(NamedTuple):
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+JSON = Serializer(lambda v: json.dumps(v, separators=(",", ":")).encode(), json.loads)
+PICKLE = Serializer(functools.partial(pickle.dumps, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads)
+
+
+class CacheBackend(abc.ABC):
+    """Shared tier of TieredCache, stores serialized values under full keys."""
+
+    name: str = "cache"
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    async def get_many(self, keys: Sequence[str]) -> list[Optional[bytes]]:
+        return [await self.get(k) for k in keys]
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, *keys: str):
+        ...
+
+    @abc.abstractmethod
+    async def delete_prefix(self, prefix: str):
+        ...
+
+    async def close(self):
+        pass
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Process-local backend with the same behaviour as the Redis one.
+
+    Used when Redis is not configured, entries expire lazily on access.
+    """
+
+    name = "memory"
+
+    def __init__(self, *, maxsize: int = 100_000):
+        self._entries: OrderedDict[str, tuple[bytes, Optional[float]]] = OrderedDict()
+        self.maxsize = maxsize
+
+    @property
+    def stats(self):
+        return {"keys": len(self._entries), "maxsize": self.maxsize}
+
+    async def get(self, key: str):
+        if (entry := self._entries.get(key)) is None:
+            return None
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self._entries[key] = (value, None if ttl is None else time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def delete_prefix(self, prefix: str):
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+
+class RedisCacheBackend(CacheBackend):
+    """Backend shared by every process that uses the same Redis.
+
+    Errors and calls that take longer than ``timeout`` seconds are treated as misses,
+    so an unreachable Redis only makes the cache cold. Redis is tried again once per ``cooldown`` seconds.
+    """
+
+    name = "redis"
+
+    def __init__(self, uri: str, *, cooldown: float = 30.0, timeout: float = 1.0):
+        self.uri = uri
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.errors = 0
+
+        self._redis = None
+        self._lock = asyncio.Lock()
+        self._available = True
+        # monotonic time of the next attempt to use redis during an outage
+        self._retry_at = 0.0
+
+    @property
+    def stats(self):
+        return {"available": self._available, "errors": self.errors}
+
+    async def _connect(self):
+        if self._redis is None:
+            async with self._lock:
+                if self._redis is None:
+                    aioredis = importlib.import_module("aioredis")
+                    connect = aioredis.create_redis_pool(self.uri, create_connection_timeout=self.timeout)
+                    self._redis = await asyncio.wait_for(connect, self.timeout)
+
+        return self._redis
+
+    async def _call(self, method: str, *args, **kwargs):
+        # every lookup of an outage would otherwise wait for the timeout
+        if not self._available and time.monotonic() < self._retry_at:
+            return None
+
+        try:
+            redis = await self._connect()
+            result = await asyncio.wait_for(getattr(redis, method)(*args, **kwargs), self.timeout)
+        except Exception as e:  # noqa
+            self.errors += 1
+            self._retry_at = time.monotonic() + self.cooldown
+
+            # a single warning per outage instead of one per call
+            if self._available:
+                logging.warning(f"redis cache is unavailable ({e!r}), serving misses")
+                self._available = False
+            return None
+
+        if not self._available:
+            logging.info("redis cache is available again")
+            self._available = True
+
+        return result
+
+    async def get(self, key: str):
+        return await self._call("get", key)
+
+    async def get_many(self, keys: Sequence[str]):
+        if not keys:
+            return []
+
+        return await self._call("mget", *keys) or [None] * len(keys)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        pexpire = None if ttl is None else max(1, int(ttl * 1000))
+        await self._call("set", key, value, pexpire=pexpire)
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._call("delete", *keys)
+
+    async def delete_prefix(self, prefix: str):
+        async def scan_and_delete(redis):
+            batch = []
+            async for key in redis.iscan(match=f"{prefix}*", count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    await redis.delete(*batch)
+                    batch.clear()
+            if batch:
+                await redis.delete(*batch)
+
+        try:
+            await scan_and_delete(await self._connect())
+        except Exception as e:  # noqa
+            self.errors += 1
+            logging.warning(f"failed to clear redis cache prefix {prefix} ({e})")
+
+    async def close(self):
+        if self._redis is not None:
+            self._redis.close()
+            await self._redis.wait_closed()
+
+
+class TieredCache:
+    """Namespaced cache with a bounded in-process LRU in front of a shared backend.
+
+    Local entries live at most ``local_ttl`` seconds, this bounds how long a process
+    keeps serving a value after another process changed it. Values are kept
+    deserialized in the local tier, callers must not mutate them. With ``max_bytes``
+    the local tier is also bounded by the serialized size of its values.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        backend: CacheBackend,
+        *,
+        ttl: Optional[float] = None,
+        local_ttl: float = 30.0,
+        maxsize: int = 1024,
+        max_bytes: Optional[int] = None,
+        serializer: Serializer = PICKLE,
+    ):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.serializer = serializer
+
+        self._prefix = f"tomodachi:{namespace}:"
+        # key -> (value, monotonic expiration time, serialized size)
+        self._local: OrderedDict[Any, tuple[Any, float, int]] = OrderedDict()
+        self.bytes = 0
+        self._loads: SingleFlight[Any] = SingleFlight()
+
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._local)
+
+    @property
+    def stats(self):
+        return {
+            "namespace": self.namespace,
+            "size": len(self._local),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+            "local_hits": self.local_hits,
+            "remote_hits": self.remote_hits,
+            "misses": self.misses,
+            "coalesced": self._loads.coalesced,
+            "evictions": self.evictions,
+        }
+
+    def make_key(self, key: Any) -> str:
+        return f"{self._prefix}{key}"
+
+    async def get(self, key: Any, default: Any = None) -> Any:
+        value = self._get_local(key)
+
+        if value is not _MISSING:
+            self.local_hits += 1
+            return value
+
+        if (raw := await self.backend.get(self.make_key(key))) is None:
+            self.misses += 1
+            return default
+
+        if (value := await self._loads_remote(key, raw)) is _MISSING:
+            return default
+
+        self.remote_hits += 1
+        self._set_local(key, value, self.ttl, len(raw))
+        return value
+
+    async def get_many(self, keys: Iterable[Any]) -> dict[Any, Any]:
+        """Returns cached values of the keys, missing keys are left out."""
+        found, remote = {}, []
+
+        for key in keys:
+            if (value := self._get_local(key)) is _MISSING:
+                remote.append(key)
+            else:
+                self.local_hits += 1
+                found[key] = value
+
+        if remote:
+            for key, raw in zip(remote, await self.backend.get_many([self.make_key(k) for k in remote])):
+                if raw is None:
+                    self.misses += 1
+                    continue
+
+                if (value := await self._loads_remote(key, raw)) is _MISSING:
+                    continue
+
+                self.remote_hits += 1
+                found[key] = value
+                self._set_local(key, value, self.ttl, len(raw))
+
+        return found
+
+    async def _loads_remote(self, key: Any, raw: bytes) -> Any:
+        # entries written by an older format, or by a process with another serializer, are dropped as misses
+        try:
+            return self.serializer.loads(raw)
+        except Exception as e:  # noqa
+            logging.warning(f"dropping undecodable entry {self.make_key(key)} of cache ({e!r})")
+            self.misses += 1
+            await self.backend.delete(self.make_key(key))
+            return _MISSING
+
+    async def set(self, key: Any, value: Any, *, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        raw = self.serializer.dumps(value)
+        self._set_local(key, value, ttl, len(raw))
+        await self.backend.set(self.make_key(key), raw, ttl)
+
+    async def delete(self, key: Any):
+        self._pop_local(key)
+        await self.backend.delete(self.make_key(key))
+
+    async def clear(self):
+        self._local.clear()
+        self.bytes = 0
+        await self.backend.delete_prefix(self._prefix)
+
+    async def get_or_load(self, key: Any, loader: Callable[[], Awaitable[Any]], *, ttl: Optional[float] = None) -> Any:
+        """Returns cached value or stores result of the loader, concurrent misses share one load."""
+        value = await self.get(key, _MISSING)
+
+        if value is not _MISSING:
+            return value
+
+        return await self._loads.run(key, lambda: self._load(key, loader, ttl))
+
+    async def _load(self, key: Any, loader: Callable[[], Awaitable[Any]], ttl: Optional[float]):
+        value = await loader()
+        await self.set(key, value, ttl=ttl)
+        return value
+
+    def _get_local(self, key: Any) -> Any:
+        if (entry := self._local.get(key)) is None:
+            return _MISSING
+
+        value, expires_at, _size = entry
+        if expires_at <= time.monotonic():
+            self._pop_local(key)
+            return _MISSING
+
+        self._local.move_to_end(key)
+        return value
+
+    def _set_local(self, key: Any, value: Any, ttl: Optional[float], size: int):
+        self._pop_local(key)
+
+        # a value that would push out everything else is kept only in the shared tier
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        ttl = self.local_ttl if ttl is None else min(ttl, self.local_ttl)
+        self._local[key] = (value, time.monotonic() + ttl, size)
+        self.bytes += size
+
+        while len(self._local) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            self._pop_local(next(iter(self._local)))
+            self.evictions += 1
+
+    def _pop_local(self, key: Any):
+        if (entry := self._local.pop(key, None)) is not None:
+            self.bytes -= entry[2]
+
+
+def make_cache_backend(backend: str = "memory", *, uri: Optional[str] = None) -> CacheBackend:
+    if backend == "redis":
+        return RedisCacheBackend(uri)
+
+    return MemoryCacheBackend()
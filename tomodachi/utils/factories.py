@@ -4,9 +4,11 @@
 #  License, v. 2.0. If a copy of the MPL was not distributed with this
 #  file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+from typing import NamedTuple, Optional
+
 import discord
 
-__all__ = ["make_intents", "make_cache_policy"]
+__all__ = ["make_intents", "make_cache_policy", "CacheProfile", "make_cache_profile", "CACHE_PROFILES"]
 
 
 def make_intents():
@@ -28,3 +30,38 @@ def make_cache_policy():
         online=True,
         voice=False,
     )
+
+
+class CacheProfile(NamedTuple):
+    name: str
+    intents: discord.Intents
+    member_cache_flags: discord.MemberCacheFlags
+    max_messages: Optional[int]
+    chunk_guilds_at_startup: bool
+
+
+def _full():
+    # members are chunked per guild by the first command that needs them, not at startup
+    return CacheProfile("full", make_intents(), make_cache_policy(), 150, False)
+
+
+def _lean():
+    # no presence updates, members are looked up through the gateway when a command needs them
+    intents = discord.Intents(members=True, guilds=True, emojis=True, reactions=True, messages=True)
+    return CacheProfile("lean", intents, discord.MemberCacheFlags.none(), 50, False)
+
+
+def _minimal():
+    # members that are not mentioned in a message can't be looked up at all
+    intents = discord.Intents(guilds=True, emojis=True, reactions=True, messages=True)
+    return CacheProfile("minimal", intents, discord.MemberCacheFlags.none(), None, False)
+
+
+CACHE_PROFILES = {"full": _full, "lean": _lean, "minimal": _minimal}
+
+
+def make_cache_profile(name: str = "full") -> CacheProfile:
+    try:
+        return CACHE_PROFILES[name]()
+    except KeyError:
+        raise ValueError(f"unknown cache profile {name}, expected one of {', '.join(CACHE_PROFILES)}") from None
@@ -0,0 +1,241 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import logging
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+
+import aiohttp
+
+from .metrics import Histogram
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+    from .queries import Query
+
+__all__ = [
+    "WAIT_KINDS",
+    "CommandStats",
+    "CommandMetrics",
+    "metrics",
+    "record_wait",
+    "timed_wait",
+    "make_trace_config",
+    "MetricsServer",
+]
+
+# external http, database and discord rest
+WAIT_KINDS = ("http", "db", "discord")
+
+
+class _Span:
+    __slots__ = WAIT_KINDS
+
+    def __init__(self):
+        self.http = 0.0
+        self.db = 0.0
+        self.discord = 0.0
+
+
+# span of the command that runs in current task, child tasks share it
+_current_span: contextvars.ContextVar[Optional[_Span]] = contextvars.ContextVar("command_span", default=None)
+
+
+def record_wait(kind: str, seconds: float):
+    """Adds time spent waiting on an external service to the running command, if there is one."""
+    if (span := _current_span.get()) is not None:
+        setattr(span, kind, getattr(span, kind) + seconds)
+
+
+class CommandStats:
+    __slots__ = ("name", "cog", "calls", "errors", "latency", "waits")
+
+    def __init__(self, name: str, cog: str):
+        self.name = name
+        self.cog = cog
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        # time waited per invocation, by kind
+        self.waits = {kind: Histogram() for kind in WAIT_KINDS}
+
+    def merge(self, other: CommandStats):
+        self.calls += other.calls
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+
+        for kind, histogram in other.waits.items():
+            self.waits[kind].merge(histogram)
+
+
+class CommandMetrics:
+    """Invocation counts, errors and latencies of every command that was run."""
+
+    def __init__(self):
+        self.commands: dict[str, CommandStats] = {}
+        # names of commands that are running right now, by task
+        self.active: dict[asyncio.Task, str] = {}
+
+    def __iter__(self) -> Iterator[CommandStats]:
+        return iter(self.commands.values())
+
+    def by_cog(self) -> list[CommandStats]:
+        cogs: dict[str, CommandStats] = {}
+
+        for stats in self:
+            if (total := cogs.get(stats.cog)) is None:
+                total = cogs[stats.cog] = CommandStats(stats.cog, stats.cog)
+            total.merge(stats)
+
+        return list(cogs.values())
+
+    @contextlib.contextmanager
+    def invocation(self, name: str, cog: Optional[str]):
+        """Times the block as a single invocation, the block sets ``failed`` on the yielded object."""
+        if (stats := self.commands.get(name)) is None:
+            stats = self.commands[name] = CommandStats(name, cog or "none")
+
+        task = asyncio.current_task()
+        self.active[task] = name
+
+        span = _Span()
+        token = _current_span.set(span)
+        outcome = SimpleNamespace(failed=False)
+        started = time.perf_counter()
+
+        try:
+            yield outcome
+        except BaseException:
+            outcome.failed = True
+            raise
+        finally:
+            _current_span.reset(token)
+            self.active.pop(task, None)
+
+            stats.calls += 1
+            stats.errors += outcome.failed
+            stats.latency.observe(time.perf_counter() - started)
+
+            for kind in WAIT_KINDS:
+                stats.waits[kind].observe(getattr(span, kind))
+
+    def render_prometheus(self, queries: Iterable[Query] = ()) -> str:
+        lines = []
+
+        def histogram(name: str, labels: str, h: Histogram):
+            for bound, count in h.cumulative():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {h.total}")
+            lines.append(f"{name}_count{{{labels}}} {h.count}")
+
+        commands = sorted(self, key=lambda s: s.name)
+
+        lines.append("# HELP tomodachi_command_invocations_total Command invocations.")
+        lines.append("# TYPE tomodachi_command_invocations_total counter")
+        for s in commands:
+            lines.append(f'tomodachi_command_invocations_total{{command="{s.name}",cog="{s.cog}"}} {s.calls}')
+
+        lines.append("# HELP tomodachi_command_errors_total Command invocations that failed.")
+        lines.append("# TYPE tomodachi_command_errors_total counter")
+        for s in commands:
+            lines.append(f'tomodachi_command_errors_total{{command="{s.name}",cog="{s.cog}"}} {s.errors}')
+
+        lines.append("# HELP tomodachi_command_seconds Command latency.")
+        lines.append("# TYPE tomodachi_command_seconds histogram")
+        for s in commands:
+            histogram("tomodachi_command_seconds", f'command="{s.name}",cog="{s.cog}"', s.latency)
+
+        lines.append("# HELP tomodachi_command_wait_seconds Time a command waited on external services.")
+        lines.append("# TYPE tomodachi_command_wait_seconds histogram")
+        for s in commands:
+            for kind, h in s.waits.items():
+                histogram("tomodachi_command_wait_seconds", f'command="{s.name}",cog="{s.cog}",kind="{kind}"', h)
+
+        lines.append("# HELP tomodachi_query_seconds Database query latency.")
+        lines.append("# TYPE tomodachi_query_seconds histogram")
+        for q in queries:
+            histogram("tomodachi_query_seconds", f'query="{q.name}"', q.histogram)
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = CommandMetrics()
+
+
+def make_trace_config() -> aiohttp.TraceConfig:
+    """Trace config for client sessions, their requests count as external http waits."""
+
+    async def on_request_start(_session, trace_ctx, _params):
+        trace_ctx.started = time.perf_counter()
+
+    async def on_request_done(_session, trace_ctx, _params):
+        record_wait("http", time.perf_counter() - trace_ctx.started)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_done)
+    trace_config.on_request_exception.append(on_request_done)
+
+    return trace_config
+
+
+class MetricsServer:
+    """Local HTTP endpoint that serves metrics in Prometheus text format at /metrics."""
+
+    def __init__(self, host: str, port: int, render):
+        self.host = host
+        self.port = port
+        self.render = render
+
+        self.__runner_: Optional[web.AppRunner] = None
+
+    async def _handle(self, _request: web.Request):
+        from aiohttp import web
+
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        # the server module is large and needed only when the endpoint is enabled
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+
+        self.__runner_ = web.AppRunner(app, access_log=None)
+        await self.__runner_.setup()
+        await web.TCPSite(self.__runner_, self.host, self.port).start()
+
+        logging.info(f"metrics are served at http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self.__runner_ is not None:
+            await self.__runner_.cleanup()
+
+
+def timed_wait(kind: str):
+    """Decorates a coroutine function so its duration counts as a wait of the kind."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                record_wait(kind, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,97 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import sys
+import types
+from collections import deque
+from typing import Any, Iterable, NamedTuple, Optional
+
+__all__ = ["deep_sizeof", "estimate_bytes", "peak_rss", "CacheUsage"]
+
+# objects of these types are shared or static, they are never counted
+_SKIP = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+class CacheUsage(NamedTuple):
+    name: str
+    count: int
+    bytes: int
+
+
+def deep_sizeof(obj: Any, *, stop: tuple[type, ...] = (), limit: int = 10_000) -> int:
+    """Approximate size of an object with everything it references.
+
+    Objects of ``stop`` types are not followed unless it's ``obj`` itself,
+    that keeps a member from counting its guild, state and the rest of the cache.
+    """
+    seen = set()
+    pending = deque([obj])
+    size = 0
+
+    while pending and len(seen) < limit:
+        o = pending.popleft()
+
+        if id(o) in seen or isinstance(o, _SKIP) or (o is not obj and isinstance(o, stop)):
+            continue
+
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+
+        if isinstance(o, dict):
+            pending.extend(o.keys())
+            pending.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            pending.extend(o)
+        elif isinstance(o, (str, bytes, int, float, bool)) or o is None:
+            continue
+        else:
+            if hasattr(o, "__dict__"):
+                pending.append(o.__dict__)
+
+            for cls in type(o).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if isinstance(slot, str) and (value := getattr(o, slot, None)) is not None:
+                        pending.append(value)
+
+    return size
+
+
+async def estimate_bytes(objects: Iterable[Any], count: int, *, stop: tuple[type, ...] = (), sample: int = 20) -> int:
+    """Estimates total size of ``count`` objects from the size of a sample of them.
+
+    Each sampled object may walk up to the ``limit`` of deep_sizeof, the loop gets control back between them.
+    """
+    if not count:
+        return 0
+
+    # walking a whole cache of millions of members would block the loop, so the first ones are used
+    picked = list(itertools.islice(objects, sample))
+
+    if not picked:
+        return 0
+
+    size = 0
+    for o in picked:
+        size += deep_sizeof(o, stop=stop)
+        await asyncio.sleep(0)
+
+    return size * count // len(picked)
+
+
+def peak_rss() -> Optional[float]:
+    """Peak resident set size of this process in megabytes, None on platforms without getrusage."""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macos, kilobytes on linux and bsd
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
@@ -0,0 +1,88 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import bisect
+import math
+
+__all__ = ["Histogram", "PoolTelemetry", "LATENCY_BUCKETS"]
+
+# upper bounds of latency buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in seconds."""
+
+    __slots__ = ("bounds", "buckets", "count", "total")
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * len(bounds)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other: Histogram):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.total += other.total
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Returns upper bound of the bucket that holds the q-th quantile."""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+
+        for bound, n in zip(self.bounds, self.buckets):
+            seen += n
+            if seen >= rank:
+                # the last bucket has no upper bound, mean is the best guess there
+                return bound if bound != math.inf else max(self.mean, self.bounds[-2])
+
+        return self.bounds[-2]
+
+    def cumulative(self):
+        """Yields (upper bound, cumulative count) pairs, as Prometheus expects them."""
+        seen = 0
+        for bound, n in zip(self.bounds, self.buckets):
+            seen += n
+            yield bound, seen
+
+
+class PoolTelemetry:
+    """Counters of a connection pool, updated on every acquire and release."""
+
+    __slots__ = ("acquires", "timeouts", "in_use", "peak_in_use", "connections_opened", "wait")
+
+    def __init__(self):
+        self.acquires = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.connections_opened = 0
+        self.wait = Histogram()
+
+    def acquired(self, waited: float):
+        self.acquires += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self.wait.observe(waited)
+
+    def released(self):
+        self.in_use -= 1
@@ -0,0 +1,96 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import logging
+from typing import NamedTuple, Sequence
+
+import asyncpg
+
+__all__ = ["Migration", "MIGRATIONS", "migrate"]
+
+# key of advisory lock that keeps processes from migrating at the same time
+MIGRATIONS_LOCK_ID = 0x746F6D6F
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(
+        1,
+        "create guilds and blacklisted",
+        """
+        CREATE TABLE IF NOT EXISTS guilds (
+            guild_id BIGINT PRIMARY KEY,
+            prefix TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS blacklisted (
+            user_id BIGINT PRIMARY KEY,
+            reason TEXT NOT NULL DEFAULT 'No reason'
+        );
+        """,
+    ),
+    Migration(
+        2,
+        "primary keys for tables created before migrations",
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_index WHERE indrelid = 'guilds'::regclass AND indisprimary) THEN
+                DELETE FROM guilds a USING guilds b WHERE a.guild_id = b.guild_id AND a.ctid < b.ctid;
+                ALTER TABLE guilds ADD PRIMARY KEY (guild_id);
+            END IF;
+
+            IF NOT EXISTS (SELECT 1 FROM pg_index WHERE indrelid = 'blacklisted'::regclass AND indisprimary) THEN
+                DELETE FROM blacklisted a USING blacklisted b WHERE a.user_id = b.user_id AND a.ctid < b.ctid;
+                ALTER TABLE blacklisted ADD PRIMARY KEY (user_id);
+            END IF;
+        END $$;
+        """,
+    ),
+    Migration(
+        3,
+        "covering index for prefix lookups",
+        # lets the per-guild prefix lookup be answered by an index-only scan
+        "CREATE INDEX IF NOT EXISTS guilds_guild_id_prefix_idx ON guilds (guild_id) INCLUDE (prefix);",
+    ),
+)
+
+
+async def migrate(conn: asyncpg.Connection, migrations: Sequence[Migration] = MIGRATIONS):
+    """Applies migrations that are not recorded in schema_migrations yet."""
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1);", MIGRATIONS_LOCK_ID)
+
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """
+        )
+
+        applied = {r["version"] for r in await conn.fetch("SELECT version FROM schema_migrations;")}
+
+        for migration in sorted(migrations, key=lambda m: m.version):
+            if migration.version in applied:
+                continue
+
+            await conn.execute(migration.sql)
+            await conn.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES ($1, $2);",
+                migration.version,
+                migration.name,
+            )
+            logging.info(f"applied migration {migration.version}: {migration.name}")
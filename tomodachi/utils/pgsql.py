@@ -5,32 +5,84 @@
 #  file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 import asyncio
+import contextlib
+import json
 import logging
-from typing import Optional
+import time
+import uuid
+from typing import Any, Iterable, Optional
 
 import asyncpg
 
+from .metrics import PoolTelemetry
+from .migrations import migrate
+from .queries import PreparedConnection, QueryRegistry
+from .settings import GuildSettingsCache
 from .singleton import MetaSingleton
+from .storage import StorageBackend
+from .writebehind import WriteBehindQueue, WriteBatch
 
-__all__ = ["pg"]
+__all__ = ["pg", "queries", "PostgresBackend"]
 
+# channel used to share cache changes between bot processes
+NOTIFY_CHANNEL = "tomodachi_cache"
 
-class pg(metaclass=MetaSingleton):  # noqa
-    def __init__(self):
+queries = QueryRegistry()
+
+FETCH_PREFIX = queries.register("fetch_prefix", "SELECT prefix FROM guilds WHERE guild_id = $1;")
+UPDATE_PREFIX = queries.register("update_prefix", "UPDATE guilds SET prefix = $1 WHERE guild_id = $2 RETURNING prefix;")
+UPSERT_PREFIXES = queries.register(
+    "upsert_prefixes",
+    "INSERT INTO guilds(guild_id, prefix) SELECT * FROM unnest($1::bigint[], $2::text[]) "
+    "ON CONFLICT (guild_id) DO UPDATE SET prefix = excluded.prefix;",
+)
+STORE_GUILDS = queries.register(
+    "store_guilds",
+    "INSERT INTO guilds(guild_id) SELECT unnest($1::bigint[]) ON CONFLICT DO NOTHING;",
+)
+FETCH_BLACKLIST = queries.register("fetch_blacklist", "SELECT user_id FROM blacklisted;")
+BLOCK = queries.register(
+    "block",
+    "INSERT INTO blacklisted (user_id, reason) VALUES ($1, $2) ON CONFLICT DO NOTHING RETURNING TRUE;",
+)
+BLOCK_MANY = queries.register(
+    "block_many",
+    "INSERT INTO blacklisted (user_id, reason) SELECT * FROM unnest($1::bigint[], $2::text[]) ON CONFLICT DO NOTHING;",
+)
+UNBLOCK = queries.register("unblock", "DELETE FROM blacklisted WHERE user_id = $1;")
+UNBLOCK_MANY = queries.register("unblock_many", "DELETE FROM blacklisted WHERE user_id = ANY($1::bigint[]);")
+NOTIFY = queries.register("notify", "SELECT pg_notify($1, $2);")
+NOTIFY_MANY = queries.register("notify_many", "SELECT pg_notify($1, p) FROM unnest($2::text[]) AS p;")
+
+
+class PostgresBackend(StorageBackend):
+    name = "postgres"
+
+    def __init__(
+        self,
+        dsn: str,
+        *,
+        pool_options: Optional[dict[str, Any]] = None,
+        acquire_timeout: Optional[float] = None,
+        connect_retries: int = 1,
+    ):
+        super().__init__()
         self.__pool_: Optional[asyncpg.Pool] = None
+        self.__dsn_ = dsn
+        # dedicated connection that receives cache changes made by other processes
+        self.__listener_: Optional[asyncpg.Connection] = None
+        self.__closing_ = False
 
-        # this event can be used to understand when
-        # the bot has a connection to the database
-        self.connection_established = asyncio.Event()
+        self.pool_options = pool_options or {}
+        self.acquire_timeout = acquire_timeout
+        self.connect_retries = connect_retries
 
-    async def setup(self, dsn: str):
-        try:
-            self.__pool_ = await asyncpg.create_pool(dsn)
-        except:  # noqa
-            raise
-        else:
-            self.connection_established.set()
-            logging.info("connection to pgsql established")
+        self.telemetry = PoolTelemetry()
+
+    @property
+    def queries(self):
+        # named statements with their call counts and latencies
+        return queries
 
     @property
     def pool(self):
@@ -40,24 +92,334 @@ class pg(metaclass=MetaSingleton):  # noqa
     def pool(self, value):
         raise AttributeError("Can not set this.") from None
 
-    async def store_guild(self, guild_id: int):
-        async with self.__pool_.acquire() as conn:
+    async def setup(self):
+        started = time.perf_counter()
+        delay = 1.0
+
+        for attempt in range(1, self.connect_retries + 1):
+            try:
+                # schema has to be in place before the pool prepares statements
+                await self.migrate(timeout=self.pool_options.get("timeout", 60.0))
+
+                # min_size connections are opened concurrently before the pool is returned
+                self.__pool_ = await asyncpg.create_pool(
+                    self.__dsn_,
+                    connection_class=PreparedConnection,
+                    init=self._init_connection,
+                    **self.pool_options,
+                )
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+                if attempt == self.connect_retries:
+                    raise
+
+                logging.warning(f"connection to pgsql failed ({e}), retry {attempt}/{self.connect_retries} in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            else:
+                break
+
+        await self.listen()
+        logging.info(f"connection to pgsql established in {time.perf_counter() - started:.2f}s")
+
+    async def migrate(self, *, timeout: float = 60.0):
+        conn = await asyncpg.connect(self.__dsn_, timeout=timeout)
+
+        try:
+            await migrate(conn)
+        finally:
+            await conn.close()
+
+    async def _init_connection(self, conn: PreparedConnection):
+        self.telemetry.connections_opened += 1
+        await queries.prepare(conn)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+
+        try:
+            conn = await self.__pool_.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.telemetry.timeouts += 1
+            raise
+
+        self.telemetry.acquired(time.perf_counter() - started)
+
+        try:
+            yield conn
+        finally:
+            self.telemetry.released()
+            await self.__pool_.release(conn)
+
+    @property
+    def stats(self):
+        pool, t = self.__pool_, self.telemetry
+        # asyncpg has no public way to count opened connections of the pool
+        size = sum(h._con is not None for h in pool._holders) if pool else 0  # noqa
+
+        return {
+            "size": size,
+            "in_use": t.in_use,
+            "idle": max(size - t.in_use, 0),
+            "peak_in_use": t.peak_in_use,
+            "opened": t.connections_opened,
+            "acquires": t.acquires,
+            "timeouts": t.timeouts,
+            "wait_p50_ms": round(t.wait.quantile(0.5) * 1000, 2),
+            "wait_p99_ms": round(t.wait.quantile(0.99) * 1000, 2),
+        }
+
+    async def listen(self):
+        self.__listener_ = await asyncpg.connect(self.__dsn_)
+        self.__listener_.add_termination_listener(self._on_listener_termination)
+        await self.__listener_.add_listener(NOTIFY_CHANNEL, self._on_notification)
+
+    async def close(self):
+        self.__closing_ = True
+
+        if self.__listener_ is not None and not self.__listener_.is_closed():
+            await self.__listener_.close()
+
+        if self.__pool_ is not None:
+            await self.__pool_.close()
+
+    def _on_listener_termination(self, _conn):
+        if self.__closing_:
+            return
+
+        logging.warning("pgsql listener connection lost, reconnecting")
+        asyncio.create_task(self._reconnect_listener())
+
+    async def _reconnect_listener(self):
+        delay = 1.0
+
+        while True:
+            try:
+                await self.listen()
+            except (OSError, asyncpg.PostgresError):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+            else:
+                break
+
+        # changes published while the listener was down are lost, so caches are reloaded
+        if self.on_resync is not None:
+            await self.on_resync()
+        logging.info("pgsql listener reconnected")
+
+    def _on_notification(self, _conn, _pid, _channel, payload: str):
+        try:
+            delta = json.loads(payload)
+        except ValueError:
+            return logging.warning(f"malformed cache notification: {payload!r}")
+
+        if delta.get("origin") != self.origin and self.on_delta is not None:
+            self.on_delta(delta)
+
+    def make_payload(self, op: str, **fields) -> str:
+        return json.dumps({"op": op, "origin": self.origin, **fields})
+
+    async def publish(self, conn: asyncpg.Connection, payload: str):
+        await NOTIFY.execute(conn, NOTIFY_CHANNEL, payload)
+
+    async def store_guilds(self, guild_ids: list[int], *, chunk_size: int = 5_000):
+        async with self.acquire() as conn:
+            for i in range(0, len(guild_ids), chunk_size):
+                await STORE_GUILDS.execute(conn, guild_ids[i : i + chunk_size])
+
+    async def write_batch(self, batch: WriteBatch):
+        payloads = []
+
+        async with self.acquire() as conn:
             async with conn.transaction():
-                await self.pool.execute("INSERT INTO guilds(guild_id) VALUES($1) ON CONFLICT DO NOTHING;", guild_id)
+                if guilds := batch.get("guild"):
+                    await STORE_GUILDS.execute(conn, list(guilds))
+
+                if prefixes := batch.get("prefix"):
+                    await UPSERT_PREFIXES.execute(conn, list(prefixes.keys()), list(prefixes.values()))
+                    payloads += [self.make_payload("prefix", guild_id=k, prefix=v) for k, v in prefixes.items()]
+
+                if users := batch.get("blacklist"):
+                    # reason of None marks unblocked user
+                    blocked = {k: v for k, v in users.items() if v is not None}
+                    unblocked = [k for k, v in users.items() if v is None]
+
+                    if blocked:
+                        await BLOCK_MANY.execute(conn, list(blocked.keys()), list(blocked.values()))
+                        payloads += [self.make_payload("block", user_id=k) for k in blocked]
+
+                    if unblocked:
+                        await UNBLOCK_MANY.execute(conn, unblocked)
+                        payloads += [self.make_payload("unblock", user_id=k) for k in unblocked]
+
+                if payloads:
+                    await NOTIFY_MANY.execute(conn, NOTIFY_CHANNEL, payloads)
 
     async def update_prefix(self, guild_id: int, new_prefix: str):
-        async with self.__pool_.acquire() as conn:
-            query = "UPDATE guilds SET prefix = $1 WHERE guild_id = $2 RETURNING prefix;"
-            prefix = await conn.fetchval(query, new_prefix, guild_id)
+        async with self.acquire() as conn:
+            # notification is delivered to listeners only when transaction commits
+            async with conn.transaction():
+                prefix = await UPDATE_PREFIX.fetchval(conn, new_prefix, guild_id)
+                await self.publish(conn, self.make_payload("prefix", guild_id=guild_id, prefix=prefix))
+
         return prefix
 
+    async def fetch_prefix(self, guild_id: int):
+        async with self.acquire() as conn:
+            return await FETCH_PREFIX.fetchval(conn, guild_id)
+
+    async def fetch_blacklist(self):
+        async with self.acquire() as conn:
+            records = await FETCH_BLACKLIST.fetch(conn)
+
+        return [r["user_id"] for r in records]
+
+    async def block(self, user_id: int, reason: str):
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                if is_blacklisted := await BLOCK.fetchval(conn, user_id, reason):
+                    await self.publish(conn, self.make_payload("block", user_id=user_id))
+
+        return is_blacklisted
+
+    async def unblock(self, user_id: int):
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                await UNBLOCK.execute(conn, user_id)
+                await self.publish(conn, self.make_payload("unblock", user_id=user_id))
+
+
+class pg(metaclass=MetaSingleton):  # noqa
+    """Data layer of the bot, caches prefixes and blacklist in front of a storage backend."""
+
+    def __init__(self):
+        self.backend: Optional[StorageBackend] = None
+        # notifications published by this process carry this id and are skipped on receive
+        self.origin = uuid.uuid4().hex
+
+        # queue of coalesced writes, new guilds always go through it and the rest
+        # of writes only when write-behind mode is enabled
+        self.writes = WriteBehindQueue(self._write_batch)
+        self.write_behind = False
+
+        # custom prefixes of guilds, loaded on first use and kept in sync by update_prefix
+        self.prefixes = GuildSettingsCache(self.fetch_prefix)
+        # ids of blacklisted users, kept in sync by block and unblock
+        self.blacklist: set[int] = set()
+
+        # this event can be used to understand when
+        # the bot has a connection to the database
+        self.connection_established = asyncio.Event()
+
+    async def setup(
+        self,
+        backend: StorageBackend,
+        *,
+        prefix_cache_size: int = 10_000,
+        write_behind: bool = False,
+        flush_interval: float = 1.0,
+        max_pending_writes: int = 500,
+    ):
+        self.prefixes.maxsize = prefix_cache_size
+
+        self.write_behind = write_behind
+        self.writes.interval = flush_interval
+        self.writes.max_pending = max_pending_writes
+
+        backend.origin = self.origin
+        backend.on_delta = self.apply_delta
+        backend.on_resync = self.resync
+
+        await backend.setup()
+        self.backend = backend
+        self.connection_established.set()
+
+    @property
+    def pool(self):
+        return getattr(self.backend, "pool", None)
+
+    @property
+    def queries(self):
+        return self.backend.queries if self.backend else ()
+
+    async def flush(self):
+        await self.writes.flush()
+
+    async def close(self):
+        if self.backend is not None:
+            await self.flush()
+            await self.backend.close()
+
+    def apply_delta(self, delta: dict):
+        op = delta["op"]
+
+        if op == "prefix":
+            # guilds that are not cached here will load the new value on first use
+            self.prefixes.refresh(delta["guild_id"], delta["prefix"])
+
+        elif op == "block":
+            self.blacklist.add(delta["user_id"])
+
+        elif op == "unblock":
+            self.blacklist.discard(delta["user_id"])
+
+    async def resync(self):
+        self.prefixes.clear()
+        await self.fetch_blacklist()
+
+    async def store_guild(self, guild_id: int):
+        await self.store_guilds((guild_id,))
+
+    async def store_guilds(self, guild_ids: Iterable[int]):
+        await self.backend.store_guilds(list(guild_ids))
+
+    def register_guild(self, guild_id: int):
+        """Stores the guild with the next batch of writes, coalescing bursts of joins."""
+        self.writes.put("guild", guild_id)
+
+    async def _write_batch(self, batch: WriteBatch):
+        await self.backend.write_batch(batch)
+
+    async def update_prefix(self, guild_id: int, new_prefix: str):
+        if self.write_behind:
+            self.prefixes.set(guild_id, new_prefix)
+            self.writes.put("prefix", guild_id, new_prefix)
+            return new_prefix
+
+        if (prefix := await self.backend.update_prefix(guild_id, new_prefix)) is not None:
+            self.prefixes.set(guild_id, prefix)
+        return prefix
+
+    async def fetch_prefix(self, guild_id: int) -> Optional[str]:
+        await self.connection_established.wait()
+        return await self.backend.fetch_prefix(guild_id)
+
+    async def fetch_blacklist(self):
+        user_ids = await self.backend.fetch_blacklist()
+
+        # updated in place, so references to the set stay valid
+        self.blacklist.clear()
+        self.blacklist.update(user_ids)
+        return self.blacklist
+
     async def block(self, snowflake: int, reason: str = "No reason"):
-        async with self.__pool_.acquire() as conn:
-            query = "INSERT INTO blacklisted (user_id, reason) VALUES ($1, $2) RETURNING TRUE;"
-            is_blacklisted = await conn.fetchval(query, snowflake, reason)
+        if self.write_behind:
+            if snowflake in self.blacklist:
+                return None
+
+            self.blacklist.add(snowflake)
+            self.writes.put("blacklist", snowflake, reason)
+            return True
+
+        if is_blacklisted := await self.backend.block(snowflake, reason):
+            self.blacklist.add(snowflake)
         return is_blacklisted
 
     async def unblock(self, snowflake: int):
-        async with self.__pool_.acquire() as conn:
-            query = "DELETE FROM blacklisted WHERE user_id = $1;"
-            await conn.execute(query, snowflake)
+        if self.write_behind:
+            self.blacklist.discard(snowflake)
+            self.writes.put("blacklist", snowflake, None)
+            return
+
+        await self.backend.unblock(snowflake)
+        self.blacklist.discard(snowflake)
@@ -0,0 +1,101 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Iterator
+
+import asyncpg
+
+from .instrumentation import record_wait
+from .metrics import Histogram
+
+__all__ = ["Query", "QueryRegistry", "PreparedConnection"]
+
+
+class PreparedConnection(asyncpg.Connection):
+    """Connection that keeps statements of a query registry prepared."""
+
+    __slots__ = ("prepared",)
+
+
+class Query:
+    __slots__ = ("name", "sql", "calls", "errors", "histogram")
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.histogram = Histogram()
+
+    def __repr__(self):
+        return f"<Query name={self.name} calls={self.calls}>"
+
+    async def _run(self, conn, method: str, *args):
+        prepared = getattr(conn, "prepared", None)
+        statement = prepared.get(self.name) if prepared else None
+
+        started = time.perf_counter()
+
+        try:
+            if statement is not None:
+                return await getattr(statement, method)(*args)
+            return await getattr(conn, method)(self.sql, *args)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.calls += 1
+            self.histogram.observe(elapsed)
+            record_wait("db", elapsed)
+
+    async def fetch(self, conn, *args):
+        return await self._run(conn, "fetch", *args)
+
+    async def fetchrow(self, conn, *args):
+        return await self._run(conn, "fetchrow", *args)
+
+    async def fetchval(self, conn, *args):
+        return await self._run(conn, "fetchval", *args)
+
+    async def execute(self, conn, *args):
+        # prepared statements have no execute, fetch works for any statement
+        return await self._run(conn, "fetch", *args)
+
+
+class QueryRegistry:
+    """Named SQL statements, each declared once and prepared on every pool connection."""
+
+    def __init__(self):
+        self._queries: dict[str, Query] = {}
+
+    def __iter__(self) -> Iterator[Query]:
+        return iter(self._queries.values())
+
+    def __getitem__(self, name: str) -> Query:
+        return self._queries[name]
+
+    def register(self, name: str, sql: str) -> Query:
+        if name in self._queries:
+            raise ValueError(f"query {name} is already registered")
+
+        query = self._queries[name] = Query(name, sql)
+        return query
+
+    async def prepare(self, conn: PreparedConnection):
+        """Pool ``init`` hook."""
+        conn.prepared = {}
+
+        for query in self._queries.values():
+            try:
+                conn.prepared[query.name] = await conn.prepare(query.sql)
+            except asyncpg.PostgresError as e:
+                # unprepared queries still work, they just go through the statement cache
+                logging.warning(f"could not prepare query {query.name}: {e}")
@@ -0,0 +1,225 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import importlib
+import logging
+import math
+import time
+from typing import Any, Optional
+
+__all__ = ["RateLimiter", "LocalRateLimiter", "RedisRateLimiter", "make_rate_limiter"]
+
+# GCRA: the stored value is a "theoretical arrival time", the moment when the key
+# would be fully replenished again. Returns seconds to wait as a string,
+# since Lua numbers are truncated to integers on the way back.
+_GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local period = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+
+if tat < now then
+    tat = now
+end
+
+local new_tat = tat + interval
+local allow_at = new_tat - period
+
+if now < allow_at then
+    return tostring(allow_at - now)
+end
+
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return '0'
+"""
+
+
+class RateLimiter(abc.ABC):
+    """Allows ``rate`` hits per ``per`` seconds for every key."""
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        # time it takes to restore a single hit
+        self.interval = per / rate
+
+    @abc.abstractmethod
+    async def hit(self, key: int) -> float:
+        """Registers a hit and returns seconds to wait, zero means the hit is allowed."""
+
+    async def close(self):
+        pass
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {}
+
+
+class LocalRateLimiter(RateLimiter):
+    """In-process GCRA limiter, state of a key is a single float.
+
+    Keys that are fully replenished carry no information, so they are evicted
+    by a time wheel with ``resolution`` seconds per slot.
+    """
+
+    def __init__(self, rate: int, per: float, *, resolution: float = 1.0):
+        super().__init__(rate, per)
+        self._tats: dict[int, float] = {}
+        self._wheel: dict[int, list[int]] = {}
+        self._cursor = math.floor(time.monotonic() / resolution)
+        self.resolution = resolution
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._tats)
+
+    @property
+    def stats(self):
+        return {"keys": len(self._tats), "wheel_slots": len(self._wheel), "evictions": self.evictions}
+
+    def hit_now(self, key: int, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._advance(now)
+
+        stored = self._tats.get(key)
+        new_tat = max(stored or now, now) + self.interval
+        allow_at = new_tat - self.per
+
+        if now < allow_at:
+            return allow_at - now
+
+        # key is scheduled for eviction once per slot its replenish time falls into
+        slot = math.floor(new_tat / self.resolution)
+        if stored is None or slot != math.floor(stored / self.resolution):
+            self._wheel.setdefault(slot, []).append(key)
+
+        self._tats[key] = new_tat
+        return 0.0
+
+    async def hit(self, key: int) -> float:
+        return self.hit_now(key)
+
+    def _advance(self, now: float):
+        current = math.floor(now / self.resolution)
+
+        # after a long quiet period it is cheaper to look only at occupied slots
+        if current - self._cursor > len(self._wheel):
+            slots = sorted(slot for slot in self._wheel if slot < current)
+        else:
+            slots = range(self._cursor, current)
+
+        for slot in slots:
+            for key in self._wheel.pop(slot, ()):
+                # key might have been hit again and scheduled into a later slot
+                if (tat := self._tats.get(key)) is not None and tat <= now:
+                    del self._tats[key]
+                    self.evictions += 1
+
+        self._cursor = max(self._cursor, current)
+
+
+class RedisRateLimiter(RateLimiter):
+    """GCRA limiter shared by every process that uses the same Redis.
+
+    Falls back to a local limiter while Redis is unreachable or doesn't answer within ``timeout`` seconds,
+    Redis is tried again once per ``cooldown`` seconds.
+    """
+
+    def __init__(
+        self,
+        rate: int,
+        per: float,
+        uri: str,
+        *,
+        namespace: str = "tomodachi:ratelimit",
+        cooldown: float = 30.0,
+        timeout: float = 1.0,
+    ):
+        super().__init__(rate, per)
+        self.uri = uri
+        self.namespace = namespace
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.fallback = LocalRateLimiter(rate, per)
+        self.errors = 0
+
+        # monotonic time of the next attempt to use redis during an outage
+        self._retry_at = 0.0
+        self._available = True
+
+        self._redis = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def stats(self):
+        return {
+            "available": self._available,
+            "errors": self.errors,
+            **{f"fallback_{k}": v for k, v in self.fallback.stats.items()},
+        }
+
+    async def _connect(self):
+        if self._redis is None:
+            async with self._lock:
+                if self._redis is None:
+                    aioredis = importlib.import_module("aioredis")
+                    connect = aioredis.create_redis_pool(self.uri, create_connection_timeout=self.timeout)
+                    self._redis = await asyncio.wait_for(connect, self.timeout)
+
+        return self._redis
+
+    async def hit(self, key: int) -> float:
+        # reconnecting on every hit of an outage would slow down every command
+        if not self._available and time.monotonic() < self._retry_at:
+            return await self.fallback.hit(key)
+
+        try:
+            redis = await self._connect()
+            # wall clock is shared between hosts, monotonic clock is not
+            args = [time.time(), self.interval, self.per]
+            # an unresponsive redis would hold up every command for as long as the socket waits
+            retry_after = await asyncio.wait_for(
+                redis.eval(_GCRA_SCRIPT, keys=[f"{self.namespace}:{key}"], args=args), self.timeout
+            )
+        except Exception as e:  # noqa
+            self.errors += 1
+            self._retry_at = time.monotonic() + self.cooldown
+
+            # a single warning per outage instead of one per hit
+            if self._available:
+                logging.warning(f"redis rate limiter is unavailable ({e!r}), using local state")
+                self._available = False
+
+            return await self.fallback.hit(key)
+
+        if not self._available:
+            logging.info("redis rate limiter is available again")
+            self._available = True
+
+        return float(retry_after)
+
+    async def close(self):
+        if self._redis is not None:
+            self._redis.close()
+            await self._redis.wait_closed()
+
+
+def make_rate_limiter(
+    rate: int,
+    per: float,
+    *,
+    backend: str = "local",
+    uri: Optional[str] = None,
+    namespace: str = "tomodachi:ratelimit",
+) -> RateLimiter:
+    if backend == "redis":
+        return RedisRateLimiter(rate, per, uri, namespace=namespace)
+
+    return LocalRateLimiter(rate, per)
@@ -0,0 +1,98 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from .singleflight import SingleFlight
+
+__all__ = ["GuildSettingsCache"]
+
+_MISSING = object()
+
+Loader = Callable[[int], Awaitable[Optional[str]]]
+
+
+class GuildSettingsCache:
+    """Bounded LRU of guild prefixes that are loaded on first use.
+
+    ``None`` is cached as well and means that guild uses the default prefix.
+    Concurrent misses for the same guild are served by a single load.
+    """
+
+    __slots__ = ("_loader", "_entries", "_loads", "maxsize", "hits", "misses", "evictions")
+
+    def __init__(self, loader: Loader, *, maxsize: int = 10_000):
+        self._loader = loader
+        self._entries: OrderedDict[int, Optional[str]] = OrderedDict()
+        self._loads: SingleFlight[Optional[str]] = SingleFlight()
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, guild_id: int):
+        return guild_id in self._entries
+
+    @property
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "pending": len(self._loads),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    async def get(self, guild_id: int) -> Optional[str]:
+        value = self._entries.get(guild_id, _MISSING)
+
+        if value is not _MISSING:
+            self.hits += 1
+            self._entries.move_to_end(guild_id)
+            return value
+
+        self.misses += 1
+        return await self._loads.run(guild_id, lambda: self._load(guild_id))
+
+    async def _load(self, guild_id: int):
+        value = await self._loader(guild_id)
+
+        # value that was set during the load is newer than the loaded one
+        if guild_id in self._entries:
+            return self._entries[guild_id]
+
+        self._store(guild_id, value)
+        return value
+
+    def set(self, guild_id: int, prefix: Optional[str]):
+        self._store(guild_id, prefix)
+
+    def refresh(self, guild_id: int, prefix: Optional[str]):
+        """Updates the entry only if guild is already cached or being loaded."""
+        if guild_id in self._entries or guild_id in self._loads:
+            self._store(guild_id, prefix)
+
+    def pop(self, guild_id: int):
+        self._entries.pop(guild_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _store(self, guild_id: int, prefix: Optional[str]):
+        self._entries[guild_id] = prefix
+        self._entries.move_to_end(guild_id)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,45 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+__all__ = ["SingleFlight"]
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Runs at most one call per key, concurrent callers of the same key share its result."""
+
+    __slots__ = ("_calls", "coalesced")
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, key: Hashable):
+        return key in self._calls
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        if (task := self._calls.get(key)) is None:
+            task = self._calls[key] = asyncio.create_task(self._run(key, func))
+        else:
+            self.coalesced += 1
+
+        # cancellation of one caller must not cancel the call for others
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        try:
+            return await func()
+        finally:
+            del self._calls[key]
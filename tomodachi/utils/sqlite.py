@@ -0,0 +1,181 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from .instrumentation import record_wait
+from .metrics import Histogram
+from .storage import StorageBackend
+from .writebehind import WriteBatch
+
+__all__ = ["SQLiteBackend"]
+
+T = TypeVar("T")
+
+# each item upgrades schema from version = index to version = index + 1
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS guilds (
+        guild_id INTEGER PRIMARY KEY,
+        prefix TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS blacklisted (
+        user_id INTEGER PRIMARY KEY,
+        reason TEXT NOT NULL DEFAULT 'No reason'
+    );
+    """,
+)
+
+
+class SQLiteBackend(StorageBackend):
+    """Storage in a local SQLite file for single-node deployments.
+
+    The connection lives in a dedicated thread, every call to it is made from there.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+
+        self.__conn_: Optional[sqlite3.Connection] = None
+        self.__executor_ = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+        self.calls = 0
+        self.latency = Histogram()
+
+    @property
+    def stats(self):
+        return {
+            "path": self.path,
+            "calls": self.calls,
+            "p50_ms": round(self.latency.quantile(0.5) * 1000, 3),
+            "p99_ms": round(self.latency.quantile(0.99) * 1000, 3),
+        }
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+
+        try:
+            return await loop.run_in_executor(self.__executor_, functools.partial(func, *args))
+        finally:
+            elapsed = time.perf_counter() - started
+            self.calls += 1
+            self.latency.observe(elapsed)
+            record_wait("db", elapsed)
+
+    async def setup(self):
+        await self._run(self._connect)
+        logging.info(f"sqlite storage opened at {self.path}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+
+        version = conn.execute("PRAGMA user_version;").fetchone()[0]
+
+        for i, script in enumerate(SCHEMA[version:], start=version + 1):
+            conn.executescript(script)
+            conn.execute(f"PRAGMA user_version = {i};")
+            logging.info(f"sqlite schema upgraded to version {i}")
+
+        self.__conn_ = conn
+
+    async def close(self):
+        if self.__conn_ is not None:
+            await self._run(self.__conn_.close)
+
+        # the close above was the last job, joining the thread would only block the loop
+        self.__executor_.shutdown(wait=False)
+
+    def _transaction(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        conn = self.__conn_
+        conn.execute("BEGIN;")
+
+        try:
+            result = func(conn)
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+        else:
+            conn.execute("COMMIT;")
+            return result
+
+    async def fetch_prefix(self, guild_id: int):
+        def query():
+            row = self.__conn_.execute("SELECT prefix FROM guilds WHERE guild_id = ?;", (guild_id,)).fetchone()
+            return row[0] if row else None
+
+        return await self._run(query)
+
+    async def update_prefix(self, guild_id: int, new_prefix: str):
+        def query():
+            cursor = self.__conn_.execute("UPDATE guilds SET prefix = ? WHERE guild_id = ?;", (new_prefix, guild_id))
+            return new_prefix if cursor.rowcount else None
+
+        return await self._run(query)
+
+    async def fetch_blacklist(self):
+        def query():
+            return [r[0] for r in self.__conn_.execute("SELECT user_id FROM blacklisted;")]
+
+        return await self._run(query)
+
+    async def block(self, user_id: int, reason: str):
+        def query():
+            query_ = "INSERT OR IGNORE INTO blacklisted (user_id, reason) VALUES (?, ?);"
+            return True if self.__conn_.execute(query_, (user_id, reason)).rowcount else None
+
+        return await self._run(query)
+
+    async def unblock(self, user_id: int):
+        def query():
+            self.__conn_.execute("DELETE FROM blacklisted WHERE user_id = ?;", (user_id,))
+
+        await self._run(query)
+
+    async def store_guilds(self, guild_ids: list[int]):
+        def query(conn: sqlite3.Connection):
+            conn.executemany("INSERT OR IGNORE INTO guilds (guild_id) VALUES (?);", ((i,) for i in guild_ids))
+
+        await self._run(self._transaction, query)
+
+    async def write_batch(self, batch: WriteBatch):
+        def query(conn: sqlite3.Connection):
+            if guilds := batch.get("guild"):
+                conn.executemany("INSERT OR IGNORE INTO guilds (guild_id) VALUES (?);", ((i,) for i in guilds))
+
+            if prefixes := batch.get("prefix"):
+                conn.executemany(
+                    "INSERT INTO guilds (guild_id, prefix) VALUES (?, ?) "
+                    "ON CONFLICT (guild_id) DO UPDATE SET prefix = excluded.prefix;",
+                    prefixes.items(),
+                )
+
+            if users := batch.get("blacklist"):
+                # reason of None marks unblocked user
+                conn.executemany(
+                    "INSERT OR IGNORE INTO blacklisted (user_id, reason) VALUES (?, ?);",
+                    ((k, v) for k, v in users.items() if v is not None),
+                )
+                conn.executemany(
+                    "DELETE FROM blacklisted WHERE user_id = ?;",
+                    ((k,) for k, v in users.items() if v is None),
+                )
+
+        await self._run(self._transaction, query)
@@ -0,0 +1,83 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import abc
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from .queries import Query
+from .writebehind import WriteBatch
+
+__all__ = ["StorageBackend", "DeltaHandler", "ResyncHandler"]
+
+# applies a cache change made by another process
+DeltaHandler = Callable[[dict], None]
+# reloads caches after changes from other processes might have been missed
+ResyncHandler = Callable[[], Awaitable[None]]
+
+
+class StorageBackend(abc.ABC):
+    """Storage used by the pg singleton.
+
+    Backends that are shared between processes publish every change as a delta
+    and hand deltas of other processes to ``on_delta``.
+    """
+
+    name: str = "storage"
+
+    def __init__(self):
+        self.origin: Optional[str] = None
+        self.on_delta: Optional[DeltaHandler] = None
+        self.on_resync: Optional[ResyncHandler] = None
+
+    @property
+    def queries(self) -> Iterable[Query]:
+        return ()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {}
+
+    @abc.abstractmethod
+    async def setup(self):
+        ...
+
+    @abc.abstractmethod
+    async def close(self):
+        ...
+
+    @abc.abstractmethod
+    async def fetch_prefix(self, guild_id: int) -> Optional[str]:
+        ...
+
+    @abc.abstractmethod
+    async def update_prefix(self, guild_id: int, new_prefix: str) -> Optional[str]:
+        """Returns new prefix or None if guild is not stored."""
+
+    @abc.abstractmethod
+    async def fetch_blacklist(self) -> list[int]:
+        ...
+
+    @abc.abstractmethod
+    async def block(self, user_id: int, reason: str) -> Optional[bool]:
+        """Returns True or None if user is blocked already."""
+
+    @abc.abstractmethod
+    async def unblock(self, user_id: int):
+        ...
+
+    @abc.abstractmethod
+    async def store_guilds(self, guild_ids: list[int]):
+        ...
+
+    @abc.abstractmethod
+    async def write_batch(self, batch: WriteBatch):
+        """Writes a batch of the write-behind queue in a single transaction.
+
+        Batch may contain ``guild`` (guild ids), ``prefix`` (guild id -> prefix)
+        and ``blacklist`` (user id -> reason, None for unblock) kinds of writes.
+        """
@@ -0,0 +1,150 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import heapq
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from .instrumentation import metrics
+from .metrics import Histogram
+
+__all__ = ["Stall", "LoopWatchdog"]
+
+
+class Stall:
+    """A period when the event loop did not run any other callback."""
+
+    __slots__ = ("duration", "at", "stack", "command", "task")
+
+    def __init__(self, at: float, stack: list[str], command: Optional[str], task: Optional[str]):
+        self.duration = 0.0
+        self.at = at
+        self.stack = stack
+        self.command = command
+        self.task = task
+
+    def __lt__(self, other: Stall):
+        return self.duration < other.duration
+
+    def __repr__(self):
+        return f"<Stall duration={self.duration:.3f} command={self.command} task={self.task}>"
+
+
+class LoopWatchdog:
+    """Measures scheduling lag of the event loop and catches what blocks it.
+
+    A heartbeat task wakes up every ``interval`` seconds and records how late it was.
+    A separate thread watches the heartbeat, once it is ``threshold`` seconds late
+    the thread captures the stack of the loop thread while the loop is still blocked.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, *, threshold: float = 0.25, interval: float = 0.1, keep=20):
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+        self.keep = keep
+
+        self.lag = Histogram()
+        self.worst: list[Stall] = []
+        self.recent: collections.deque[Stall] = collections.deque(maxlen=keep)
+        self.stalls = 0
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        # stall captured by the thread, finished by the heartbeat once loop is free again
+        self._pending: Optional[Stall] = None
+        self._beat_task: Optional[asyncio.Task] = None
+
+    @property
+    def stats(self):
+        return {
+            "stalls": self.stalls,
+            "p50_ms": round(self.lag.quantile(0.5) * 1000, 1),
+            "p99_ms": round(self.lag.quantile(0.99) * 1000, 1),
+            "max_ms": round(self.worst_stalls()[0].duration * 1000, 1) if self.worst else 0.0,
+        }
+
+    def worst_stalls(self) -> list[Stall]:
+        with self._lock:
+            return sorted(self.worst, reverse=True)
+
+    def start(self):
+        """Starts watching, has to be called from the thread that runs the loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._beat_task = self.loop.create_task(self._beat())
+
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+        if self._beat_task is not None:
+            self._beat_task.cancel()
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self.lag.observe(lag)
+
+            with self._lock:
+                self._last_beat = now
+                stall, self._pending = self._pending, None
+
+                if stall is not None:
+                    stall.duration = lag
+                    self._record(stall)
+
+            if stall is not None:
+                where = stall.stack[-1].strip() if stall.stack else "unknown"
+                logging.warning(
+                    f"event loop was blocked for {lag:.3f}s (command: {stall.command}, task: {stall.task}) at {where}"
+                )
+
+    def _record(self, stall: Stall):
+        self.stalls += 1
+        self.recent.append(stall)
+
+        if len(self.worst) < self.keep:
+            heapq.heappush(self.worst, stall)
+        elif stall.duration > self.worst[0].duration:
+            heapq.heapreplace(self.worst, stall)
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 4):
+            with self._lock:
+                late = time.monotonic() - self._last_beat - self.interval
+                if late < self.threshold or self._pending is not None:
+                    continue
+
+                self._pending = self._capture()
+
+    def _capture(self) -> Stall:
+        frame = sys._current_frames().get(self._loop_thread_id)  # noqa
+        stack = traceback.format_stack(frame, limit=30) if frame is not None else []
+
+        # the task that holds the loop is still marked as current one
+        task = asyncio.tasks._current_tasks.get(self.loop)  # noqa
+        command = metrics.active.get(task) if task is not None else None
+        task_name = task.get_name() if task is not None else None
+
+        return Stall(time.time(), stack, command, task_name)
@@ -0,0 +1,167 @@
+#  Copyright (c) 2020 — present, moretzu (モーレツ)
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+__all__ = ["WriteBehindQueue", "WriteBatch"]
+
+# kind of write -> {key: latest value}
+WriteBatch = dict[str, dict[Hashable, Any]]
+Writer = Callable[[WriteBatch], Awaitable[None]]
+
+
+class WriteBehindQueue:
+    """Collects writes in memory and hands them over to the writer in batches.
+
+    Writes are coalesced by ``(kind, key)``, so only the latest value for a key
+    reaches the database. A batch is flushed after ``interval`` seconds since the
+    first pending write or as soon as ``max_pending`` writes are queued.
+
+    A failed batch is retried with exponential backoff up to ``max_retries`` times,
+    then it's dropped. At most ``max_buffered`` writes are kept while retrying,
+    the oldest ones are dropped first.
+    """
+
+    def __init__(
+        self,
+        writer: Writer,
+        *,
+        interval: float = 1.0,
+        max_pending: int = 500,
+        max_retries: int = 5,
+        max_buffered: int = 10_000,
+        max_backoff: float = 60.0,
+    ):
+        self._writer = writer
+        self._pending: dict[tuple[str, Hashable], Any] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.max_buffered = max_buffered
+        self.max_backoff = max_backoff
+        # failed flushes in a row
+        self._retries = 0
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.written = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.last_flush_duration = 0.0
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def stats(self):
+        return {
+            "depth": len(self._pending),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_duration * 1000, 2),
+        }
+
+    def put(self, kind: str, key: Hashable, value: Any = None):
+        item = (kind, key)
+
+        if item in self._pending:
+            self.coalesced += 1
+            # re-inserting keeps writes of a key in the order they were made
+            del self._pending[item]
+
+        self._pending[item] = value
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self._pending))
+
+        # while retrying, the backoff decides when the next flush happens
+        if len(self._pending) >= self.max_pending and not self._retries:
+            self._schedule(0)
+        elif self._timer is None:
+            self._schedule(self.interval)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        self._timer = None
+        # flushes are serialized by the lock, so this one waits for a running flush
+        asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, {}
+
+            batch: WriteBatch = defaultdict(dict)
+            for (kind, key), value in pending.items():
+                batch[kind][key] = value
+
+            started = time.perf_counter()
+
+            try:
+                await self._writer(batch)
+            except Exception:  # noqa
+                self.failures += 1
+                self._retry(pending)
+            else:
+                self._retries = 0
+                self.written += len(pending)
+            finally:
+                self.flushes += 1
+                self.last_flush_duration = time.perf_counter() - started
+
+    def _retry(self, pending: dict[tuple[str, Hashable], Any]):
+        self._retries += 1
+
+        if self._retries > self.max_retries:
+            self.dropped += len(pending)
+            logging.error(f"write-behind dropped {len(pending)} writes after {self.max_retries} failed retries")
+            self._retries = 0
+            return
+
+        # a single traceback per outage, retries are only counted
+        if self._retries == 1:
+            logging.exception(f"write-behind flush of {len(pending)} writes failed, retrying")
+
+        # writes made during the flush are newer and win over the failed ones
+        pending.update(self._pending)
+        self._pending = pending
+
+        if (overflow := len(self._pending) - self.max_buffered) > 0:
+            for item in list(itertools.islice(self._pending, overflow)):
+                del self._pending[item]
+
+            self.dropped += overflow
+            logging.warning(f"write-behind dropped {overflow} oldest writes, the queue is full")
+
+        self._schedule(min(self.interval * 2 ** self._retries, self.max_backoff))